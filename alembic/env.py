@@ -12,13 +12,16 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'chatgpt_to_wordpress')))
 
 # Import the models module from the chatgpt_to_wordpress directory
-from models import Base
+from models import Base, database_url
 #from chatgpt_to_wordpress.models import Base
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
+# Migrate the database the application uses (`database_url` in config.json) rather than the one in alembic.ini.
+config.set_main_option("sqlalchemy.url", database_url.replace("%", "%%"))
+
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
 if config.config_file_name is not None:
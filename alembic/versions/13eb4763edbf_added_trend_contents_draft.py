@@ -0,0 +1,28 @@
+"""added trend_contents draft
+
+Revision ID: 13eb4763edbf
+Revises: d91826ef9a0e
+Create Date: 2026-10-16 15:08:37.419265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '13eb4763edbf'
+down_revision = 'd91826ef9a0e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # A fresh database gets trend_contents from create_all on import, already with the column.
+    columns = [column['name'] for column in sa.inspect(op.get_bind()).get_columns('trend_contents')]
+    if 'draft' not in columns:
+        op.add_column('trend_contents', sa.Column('draft', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('trend_contents') as batch_op:
+        batch_op.drop_column('draft')
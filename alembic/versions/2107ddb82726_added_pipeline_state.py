@@ -0,0 +1,74 @@
+"""added pipeline_state
+
+Revision ID: 2107ddb82726
+Revises: 6a44a77ee709
+Create Date: 2026-10-16 12:04:37.915402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2107ddb82726'
+down_revision = '6a44a77ee709'
+branch_labels = None
+depends_on = None
+
+
+def _missing(column):
+    return sa.or_(column.is_(None), column == '')
+
+
+def upgrade() -> None:
+    op.add_column('trends', sa.Column('pipeline_state', sa.String(), nullable=True, server_default='new'))
+
+    # Backfill from the columns the stages used to filter on. A trend with an article_id went through
+    # the staged WordPress flow; one without is on the single-request flow, which skips the
+    # created/updated/tags_added/excerpt_added states. Each row stops at its first missing step.
+    trends = sa.table(
+        'trends',
+        sa.column('title', sa.String),
+        sa.column('article_id', sa.Integer),
+        sa.column('article', sa.String),
+        sa.column('article_wordpress_updated', sa.Boolean),
+        sa.column('article_tags', sa.String),
+        sa.column('article_tags_added', sa.Boolean),
+        sa.column('article_excerpt', sa.String),
+        sa.column('article_excerpt_added', sa.Boolean),
+        sa.column('article_image_location', sa.String),
+        sa.column('article_status', sa.String),
+        sa.column('pipeline_state', sa.String),
+    )
+    c = trends.c
+    single = sa.case(
+        (_missing(c.title), 'new'),
+        (_missing(c.article), 'titled'),
+        (_missing(c.article_tags), 'written'),
+        (_missing(c.article_excerpt), 'tagged'),
+        (_missing(c.article_image_location), 'excerpted'),
+        else_='imaged',
+    )
+    staged = sa.case(
+        (_missing(c.title), 'new'),
+        (_missing(c.article), 'created'),
+        (c.article_wordpress_updated.is_(None), 'written'),
+        (_missing(c.article_tags), 'updated'),
+        (c.article_tags_added.is_(None), 'tagged'),
+        (_missing(c.article_excerpt), 'tags_added'),
+        (c.article_excerpt_added.is_(None), 'excerpted'),
+        (_missing(c.article_image_location), 'excerpt_added'),
+        else_='imaged',
+    )
+    op.get_bind().execute(trends.update().values(pipeline_state=sa.case(
+        (c.article_status == 'published', 'published'),
+        (c.article_id.is_(None), single),
+        else_=staged,
+    )))
+
+    op.create_index(op.f('ix_trends_pipeline_state'), 'trends', ['pipeline_state'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_trends_pipeline_state'), table_name='trends')
+    op.drop_column('trends', 'pipeline_state')
@@ -0,0 +1,29 @@
+"""added wordpress_tags crawled
+
+Revision ID: 5c0e7f3a9b21
+Revises: 13eb4763edbf
+Create Date: 2026-10-16 18:42:10.527331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0e7f3a9b21'
+down_revision = '13eb4763edbf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing rows can't tell crawled tags from created ones, so they stay unmarked and the next refresh
+    # crawls every tag once.
+    columns = [column['name'] for column in sa.inspect(op.get_bind()).get_columns('wordpress_tags')]
+    if 'crawled' not in columns:
+        op.add_column('wordpress_tags', sa.Column('crawled', sa.Boolean(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('wordpress_tags') as batch_op:
+        batch_op.drop_column('crawled')
@@ -0,0 +1,34 @@
+"""added wordpress_tags
+
+Revision ID: 6a44a77ee709
+Revises: 9025506bdfad
+Create Date: 2026-10-16 11:26:50.318240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a44a77ee709'
+down_revision = '9025506bdfad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # models.py runs create_all on import, so env.py may already have created the table.
+    if sa.inspect(op.get_bind()).has_table('wordpress_tags'):
+        return
+    op.create_table('wordpress_tags',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('normalized_name', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_wordpress_tags_normalized_name'), 'wordpress_tags', ['normalized_name'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_wordpress_tags_normalized_name'), table_name='wordpress_tags')
+    op.drop_table('wordpress_tags')
@@ -0,0 +1,33 @@
+"""added subreddit_cursors
+
+Revision ID: 9025506bdfad
+Revises: ea471140e18c
+Create Date: 2026-10-16 10:03:17.554092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9025506bdfad'
+down_revision = 'ea471140e18c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # models.py runs create_all on import, so env.py may already have created the table.
+    if sa.inspect(op.get_bind()).has_table('subreddit_cursors'):
+        return
+    op.create_table('subreddit_cursors',
+    sa.Column('subreddit', sa.String(), nullable=False),
+    sa.Column('last_fullname', sa.String(), nullable=True),
+    sa.Column('last_created_utc', sa.Float(), nullable=True),
+    sa.Column('timestamp', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('subreddit')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('subreddit_cursors')
@@ -0,0 +1,33 @@
+"""added media_uploads
+
+Revision ID: d91826ef9a0e
+Revises: dd101fb9b18e
+Create Date: 2026-10-16 14:22:51.604113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91826ef9a0e'
+down_revision = 'dd101fb9b18e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # models.py runs create_all on import, so env.py may already have created the table.
+    if sa.inspect(op.get_bind()).has_table('media_uploads'):
+        return
+    op.create_table('media_uploads',
+    sa.Column('sha256', sa.String(), nullable=False),
+    sa.Column('media_id', sa.Integer(), nullable=True),
+    sa.Column('filename', sa.String(), nullable=True),
+    sa.Column('timestamp', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('media_uploads')
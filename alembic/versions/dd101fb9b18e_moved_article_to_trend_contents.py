@@ -0,0 +1,45 @@
+"""moved article to trend_contents
+
+Revision ID: dd101fb9b18e
+Revises: 2107ddb82726
+Create Date: 2026-10-16 13:41:08.226917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dd101fb9b18e'
+down_revision = '2107ddb82726'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # models.py runs create_all on import, so env.py may already have created the table.
+    if not sa.inspect(op.get_bind()).has_table('trend_contents'):
+        op.create_table('trend_contents',
+        sa.Column('trend_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('article', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['trend_id'], ['trends.id'], ),
+        sa.PrimaryKeyConstraint('trend_id')
+        )
+
+    op.execute(
+        "INSERT INTO trend_contents (trend_id, article) "
+        "SELECT id, article FROM trends WHERE article IS NOT NULL "
+        "AND id NOT IN (SELECT trend_id FROM trend_contents)"
+    )
+    with op.batch_alter_table('trends') as batch_op:
+        batch_op.drop_column('article')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('trends') as batch_op:
+        batch_op.add_column(sa.Column('article', sa.String(), nullable=True))
+    op.execute(
+        "UPDATE trends SET article = "
+        "(SELECT article FROM trend_contents WHERE trend_contents.trend_id = trends.id)"
+    )
+    op.drop_table('trend_contents')
@@ -0,0 +1,53 @@
+"""added trend_key
+
+Revision ID: ea471140e18c
+Revises: d9d24a5a012c
+Create Date: 2026-10-16 09:12:41.208311
+
+"""
+import hashlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ea471140e18c'
+down_revision = 'd9d24a5a012c'
+branch_labels = None
+depends_on = None
+
+
+def _trend_key(trend_name: str) -> str:
+    # Kept in sync with models.trend_key; migrations must not import application code.
+    normalized: str = " ".join(trend_name.casefold().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def upgrade() -> None:
+    op.add_column('trends', sa.Column('trend_key', sa.String(), nullable=True))
+
+    # Backfill keys for existing rows. Later duplicates keep a NULL key so the unique index can be built.
+    connection = op.get_bind()
+    trends = sa.table('trends', sa.column('id', sa.Integer), sa.column('trend_name', sa.String), sa.column('trend_key', sa.String))
+    seen = set()
+    updates = []
+    for trend_id, trend_name in connection.execute(sa.select(trends.c.id, trends.c.trend_name).order_by(trends.c.id)):
+        if trend_name is None:
+            continue
+        key = _trend_key(trend_name)
+        if key in seen:
+            continue
+        seen.add(key)
+        updates.append({'trend_id': trend_id, 'key': key})
+    if updates:
+        connection.execute(
+            trends.update().where(trends.c.id == sa.bindparam('trend_id')).values(trend_key=sa.bindparam('key')),
+            updates,
+        )
+
+    op.create_index(op.f('ix_trends_trend_key'), 'trends', ['trend_key'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_trends_trend_key'), table_name='trends')
+    op.drop_column('trends', 'trend_key')
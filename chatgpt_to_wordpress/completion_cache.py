@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from config import completion_cache_enabled, completion_cache_max_age_days, completion_cache_max_entries
+
+CACHE_PATH: str = os.path.join('data', 'completions.db')
+
+
+class CompletionCache:
+    """
+    A persistent cache of OpenAI completions keyed by a hash of the request.
+
+    Entries expire after `max_age_days` and the least recently used entries are evicted once
+    more than `max_entries` are stored.
+
+    Args:
+        path (str, optional): The SQLite file to store completions in. Defaults to "data/completions.db".
+        max_entries (int, optional): The maximum number of stored completions. Defaults to `completion_cache_max_entries` from the config.
+        max_age_days (float, optional): How long a completion stays valid. Defaults to `completion_cache_max_age_days` from the config.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = completion_cache_max_entries, max_age_days: float = completion_cache_max_age_days) -> None:
+        self.max_entries: int = max_entries
+        self.max_age: float = max_age_days * 86400
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, completion TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_completions_last_used ON completions (last_used)")
+        self.connection.commit()
+
+    @staticmethod
+    def key(engine: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        """
+        Computes the content address of a completion request.
+
+        Args:
+            engine (str): The OpenAI engine or model name.
+            prompt (str): The prompt text.
+            max_tokens (int): The completion's `max_tokens`.
+            temperature (float): The sampling temperature.
+
+        Returns:
+            str: A SHA-256 hex digest of the request parameters.
+        """
+        request: str = json.dumps([engine, prompt, max_tokens, temperature], ensure_ascii=False)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Looks up a cached completion.
+
+        Args:
+            key (str): The request key from `CompletionCache.key`.
+
+        Returns:
+            Optional[str]: The cached completion, or None if it is missing or expired.
+        """
+        now: float = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT completion FROM completions WHERE key = ? AND created >= ?", (key, now - self.max_age)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+        return row[0]
+
+    def put(self, key: str, completion: str) -> None:
+        """
+        Stores a completion and evicts expired and least recently used entries.
+
+        Args:
+            key (str): The request key from `CompletionCache.key`.
+            completion (str): The completion text.
+
+        Returns:
+            None
+        """
+        now: float = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO completions (key, completion, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, completion, now, now),
+            )
+            self.connection.execute("DELETE FROM completions WHERE created < ?", (now - self.max_age,))
+            self.connection.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.connection.commit()
+
+
+_cache: Optional[CompletionCache] = None
+
+
+def get_cache() -> Optional[CompletionCache]:
+    """
+    Returns the shared completion cache, opening it on first use.
+
+    Returns:
+        Optional[CompletionCache]: The cache, or None if `completion_cache_enabled` is false in the config.
+    """
+    global _cache
+    if not completion_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = CompletionCache()
+    return _cache
@@ -1,7 +1,8 @@
 import json
 import os
 import base64
-config_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'config.json'))
+# CHATGPT_TO_WORDPRESS_CONFIG points at another config file, e.g. a throwaway one for the tests.
+config_path = os.environ.get("CHATGPT_TO_WORDPRESS_CONFIG") or os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'config.json'))
 with open(config_path, 'r') as config_file:
     keys: dict = json.load(config_file)
 my_client_id: str = keys["client_id"]
@@ -14,4 +15,57 @@ api_base_url: str = keys["api_base_url"]
 username: str = keys["username"]
 tags_url: str = keys["tags_url"]
 auth_header: str = f"{username}:{application_password}"
-auth_header = base64.b64encode(auth_header.encode("utf-8")).decode("utf-8")
\ No newline at end of file
+auth_header = base64.b64encode(auth_header.encode("utf-8")).decode("utf-8")
+
+# Optional settings; every key below may be omitted from config.json.
+image_worker_address: str = keys.get("image_worker_address", "")
+image_worker_authkey: bytes = keys.get("image_worker_authkey", "").encode("utf-8")
+image_batch_size: int = int(keys.get("image_batch_size", 0))
+image_variants: int = int(keys.get("image_variants", 1))
+generation_concurrency: int = int(keys.get("generation_concurrency", 8))
+rate_limits: dict = keys.get("rate_limits", {})
+completion_cache_enabled: bool = bool(keys.get("completion_cache_enabled", True))
+completion_cache_max_entries: int = int(keys.get("completion_cache_max_entries", 10000))
+completion_cache_max_age_days: float = float(keys.get("completion_cache_max_age_days", 30))
+subreddits: list = keys.get("subreddits", ["ChatGPT"])
+ingestion_batch_size: int = int(keys.get("ingestion_batch_size", 100))
+publish_mode: str = keys.get("publish_mode", "single")
+wordpress_pool_size: int = int(keys.get("wordpress_pool_size", 10))
+wordpress_timeout: float = float(keys.get("wordpress_timeout", 30))
+wordpress_max_retries: int = int(keys.get("wordpress_max_retries", 3))
+pipeline_poll_interval: float = float(keys.get("pipeline_poll_interval", 1.0))
+stage_concurrency: dict = keys.get("stage_concurrency", {})
+daemon_interval: float = float(keys.get("daemon_interval", 300))
+commit_batch_size: int = int(keys.get("commit_batch_size", 50))
+database_url: str = keys.get("database_url", "sqlite:///data/trends.db")
+database_pool_size: int = int(keys.get("database_pool_size", 5))
+database_busy_timeout: float = float(keys.get("database_busy_timeout", 30))
+sqlite_pragmas: dict = keys.get("sqlite_pragmas", {})
+media_upload_concurrency: int = int(keys.get("media_upload_concurrency", 4))
+image_format: str = keys.get("image_format", "webp").lower()
+image_quality: int = int(keys.get("image_quality", 80))
+image_sizes: list = keys.get("image_sizes", [])
+dedup_threshold: float = float(keys.get("dedup_threshold", 0.85))
+dedup_window: int = int(keys.get("dedup_window", 5000))
+dedup_dimensions: int = int(keys.get("dedup_dimensions", 1024))
+generation_mode: str = keys.get("generation_mode", "fields")
+generation_backend: str = keys.get("generation_backend", "completion")
+generation_model: str = keys.get("generation_model", "")
+openai_base_url: str = keys.get("openai_base_url", "https://api.openai.com/v1")
+openai_timeout: float = float(keys.get("openai_timeout", 60))
+batch_poll_interval: float = float(keys.get("batch_poll_interval", 60))
+batch_completion_window: str = keys.get("batch_completion_window", "24h")
+stream_articles: bool = bool(keys.get("stream_articles", False))
+stream_checkpoint_chars: int = int(keys.get("stream_checkpoint_chars", 400))
+stream_opening_paragraphs: int = int(keys.get("stream_opening_paragraphs", 2))
+local_llm_model: str = keys.get("local_llm_model", "")
+local_llm_fields: list = keys.get("local_llm_fields", ["tags", "excerpt"])
+local_llm_workers: int = int(keys.get("local_llm_workers", 2))
+local_llm_threads: int = int(keys.get("local_llm_threads", 0))
+local_llm_context: int = int(keys.get("local_llm_context", 2048))
+local_extraction: list = keys.get("local_extraction", [])
+extraction_min_confidence: float = float(keys.get("extraction_min_confidence", 0.6))
+extraction_batch_size: int = int(keys.get("extraction_batch_size", 100))
+metrics_port: int = int(keys.get("metrics_port", 0))
+metrics_file: str = keys.get("metrics_file", "")
+metrics_interval: float = float(keys.get("metrics_interval", 15))
@@ -0,0 +1,149 @@
+import re
+import threading
+import zlib
+from typing import List, Optional, Tuple
+import numpy as np
+from config import dedup_dimensions, dedup_threshold, dedup_window
+
+STOP_WORDS = frozenset(
+    "a about all an and any are as at be been but by can could do does for from get got has have how i if in "
+    "is it its just me my not of on or our should so that the there they this to was we what when where which "
+    "who why will with would you your".split()
+)
+
+# (trend id, trend name) in, (id of the earlier near duplicate, similarity) or None out.
+DedupJob = Tuple[int, str]
+DedupResult = Optional[Tuple[int, float]]
+
+
+def features(text: str) -> List[str]:
+    """
+    Splits a trend name into the features compared for near duplicates.
+
+    Every word other than a stop word is used as-is and also contributes its character trigrams,
+    so small spelling differences still match. Word order, case and punctuation are ignored.
+
+    Args:
+        text (str): The trend name.
+
+    Returns:
+        List[str]: The features, e.g. ["w:chatgpt", "c:^ch", ...].
+    """
+    words: List[str] = re.findall(r"\w+", text.casefold())
+    result: List[str] = []
+    for word in words:
+        if word in STOP_WORDS:
+            continue
+        result.append(f"w:{word}")
+        padded: str = f"^{word}$"
+        result.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return result
+
+
+def vectorize(text: str, dimensions: int = dedup_dimensions) -> np.ndarray:
+    """
+    Maps a trend name to a unit-length vector with the hashing trick, so no vocabulary has to be fitted or stored.
+
+    Args:
+        text (str): The trend name.
+        dimensions (int, optional): The vector size. Defaults to `dedup_dimensions` from the config.
+
+    Returns:
+        np.ndarray: A float32 vector whose dot product with another is their cosine similarity; all zeros for empty text.
+    """
+    vector: np.ndarray = np.zeros(dimensions, dtype=np.float32)
+    for feature in features(text):
+        digest: int = zlib.crc32(feature.encode("utf-8"))
+        vector[digest % dimensions] += 1.0 if digest & 0x80000000 else -1.0
+    norm: float = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class NearDuplicateIndex:
+    """
+    A brute-force cosine nearest-neighbour index over the vectors of the most recent trends.
+
+    Vectors are kept in one preallocated matrix that is used as a ring buffer, so a lookup is a
+    single matrix-vector product and memory stays at `window` x `dimensions` floats.
+
+    Args:
+        window (int, optional): How many recent trends to compare against. Defaults to `dedup_window` from the config.
+        dimensions (int, optional): The vector size. Defaults to `dedup_dimensions` from the config.
+        threshold (float, optional): The cosine similarity from which a trend counts as a duplicate. Defaults to `dedup_threshold` from the config.
+    """
+
+    def __init__(self, window: int = dedup_window, dimensions: int = dedup_dimensions, threshold: float = dedup_threshold) -> None:
+        self.window: int = max(1, window)
+        self.dimensions: int = dimensions
+        self.threshold: float = threshold
+        self.vectors: np.ndarray = np.zeros((self.window, dimensions), dtype=np.float32)
+        self.ids: np.ndarray = np.zeros(self.window, dtype=np.int64)
+        self.size: int = 0
+        self.position: int = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, trend_id: int, vector: np.ndarray) -> None:
+        """
+        Adds a trend, replacing the oldest one once the window is full.
+
+        Args:
+            trend_id (int): The trend's id.
+            vector (np.ndarray): Its vector from `vectorize`.
+
+        Returns:
+            None
+        """
+        self.vectors[self.position] = vector
+        self.ids[self.position] = trend_id
+        self.position = (self.position + 1) % self.window
+        self.size = min(self.size + 1, self.window)
+
+    def nearest(self, vector: np.ndarray, exclude: Optional[int] = None) -> Optional[Tuple[int, float]]:
+        """
+        Finds the most similar indexed trend.
+
+        Args:
+            vector (np.ndarray): The query vector from `vectorize`.
+            exclude (Optional[int], optional): A trend id to leave out, e.g. the trend being checked. Defaults to None.
+
+        Returns:
+            Optional[Tuple[int, float]]: The trend id and cosine similarity, or None if no other trend is indexed.
+        """
+        if not self.size:
+            return None
+        scores: np.ndarray = self.vectors[:self.size] @ vector
+        if exclude is not None:
+            scores = np.where(self.ids[:self.size] == exclude, -np.inf, scores)
+        best: int = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            return None
+        return int(self.ids[best]), float(scores[best])
+
+    def check(self, jobs: List[DedupJob]) -> List[DedupResult]:
+        """
+        Checks a batch of trends in order, indexing every trend that is not a near duplicate.
+
+        Trends later in the batch are also compared with the earlier ones. A trend that is checked again, e.g.
+        after its result could not be written, is never matched with itself and is not indexed twice.
+
+        Args:
+            jobs (List[DedupJob]): (trend id, trend name) pairs.
+
+        Returns:
+            List[DedupResult]: For each trend, the earlier trend it duplicates and the similarity, or None if it is new.
+        """
+        results: List[DedupResult] = []
+        with self.lock:
+            for trend_id, name in jobs:
+                vector: np.ndarray = vectorize(name or "", self.dimensions)
+                match: Optional[Tuple[int, float]] = self.nearest(vector, exclude=trend_id) if vector.any() else None
+                if match is not None and match[1] >= self.threshold:
+                    results.append(match)
+                    continue
+                if trend_id not in self.ids[:self.size]:
+                    self.add(trend_id, vector)
+                results.append(None)
+        return results
@@ -0,0 +1,132 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from dedup import STOP_WORDS
+
+# Words that break keyphrases and never rank sentences, on top of the dedup stop words.
+EXTRACTION_STOP_WORDS = STOP_WORDS | frozenset(
+    "also am another because before being between both came come did each even ever every first had he her "
+    "here him his into like made make many may more most much must new no now off often one only other out over "
+    "own said same she since some still such than their them then these those through too under up us very "
+    "want way well were while whether within without yet".split()
+)
+MIN_ARTICLE_WORDS = 50
+PHRASE_MAX_WORDS = 3
+SENTENCE_MIN_WORDS = 6
+SENTENCE_MAX_WORDS = 40
+
+# The extracted text, or None, and a confidence from 0 to 1.
+Extraction = Tuple[Optional[str], float]
+
+
+def words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9][a-z0-9'-]*", text.casefold())
+
+
+def candidate_phrases(text: str) -> List[str]:
+    """
+    Splits a text into RAKE keyphrase candidates: runs of up to three words between stop words and punctuation.
+
+    Args:
+        text (str): The article.
+
+    Returns:
+        List[str]: The candidates in order of appearance, with repeats.
+    """
+    phrases: List[str] = []
+    for fragment in re.split(r"[.,;:!?()\[\]\"\n]+", text.casefold()):
+        run: List[str] = []
+        for word in words(fragment) + [""]:
+            if word and word not in EXTRACTION_STOP_WORDS and not word.isdigit() and len(word) > 2:
+                run.append(word)
+                continue
+            if 0 < len(run) <= PHRASE_MAX_WORDS:
+                phrases.append(" ".join(run))
+            run = []
+    return phrases
+
+
+def extract_tags(articles: List[str], count: int = 10) -> List[Extraction]:
+    """
+    Picks the keyphrases of several articles as comma separated tags.
+
+    Candidates are scored RAKE-style (word degree over frequency, summed over the phrase) and weighted by
+    how rare the phrase is across the batch, so phrases every pending article shares rank lower.
+
+    Args:
+        articles (List[str]): The article texts; scoring improves with more articles per call.
+        count (int, optional): The number of tags per article. Defaults to 10.
+
+    Returns:
+        List[Extraction]: For each article the tags and the share of `count` that could be found; (None, 0.0) for
+            articles shorter than `MIN_ARTICLE_WORDS` words.
+    """
+    candidates: List[List[str]] = [candidate_phrases(article or "") for article in articles]
+    document_frequency: Counter = Counter(phrase for phrases in candidates for phrase in set(phrases))
+    total: int = len(articles)
+    results: List[Extraction] = []
+    for article, phrases in zip(articles, candidates):
+        if len(words(article or "")) < MIN_ARTICLE_WORDS or not phrases:
+            results.append((None, 0.0))
+            continue
+        frequency: Counter = Counter()
+        degree: Counter = Counter()
+        for phrase in phrases:
+            for word in phrase.split():
+                frequency[word] += 1
+                degree[word] += len(phrase.split())
+        occurrences: Counter = Counter(phrases)
+        scores: Dict[str, float] = {
+            phrase: sum(degree[word] / frequency[word] for word in phrase.split())
+            * occurrences[phrase]
+            * math.log((1 + total) / (1 + document_frequency[phrase]) + 1)
+            for phrase in occurrences
+        }
+        chosen: List[str] = []
+        seen: Set[str] = set()
+        for phrase in sorted(scores, key=lambda phrase: (-scores[phrase], phrase)):
+            # Skip phrases whose words are all covered by a better tag already.
+            if set(phrase.split()) <= seen:
+                continue
+            chosen.append(phrase)
+            seen.update(phrase.split())
+            if len(chosen) == count:
+                break
+        results.append((", ".join(chosen), len(chosen) / count))
+    return results
+
+
+def extract_excerpt(article: str, title: str = "", sentences: int = 2) -> Extraction:
+    """
+    Picks the sentences that best summarize an article as its excerpt.
+
+    Sentences are scored by the frequency of their words in the whole article, with words from the title
+    counting double, and kept in their original order.
+
+    Args:
+        article (str): The article text.
+        title (str, optional): The article title. Defaults to "".
+        sentences (int, optional): The number of sentences in the excerpt. Defaults to 2.
+
+    Returns:
+        Extraction: The excerpt and a confidence that drops when the article has few usable sentences.
+    """
+    if len(words(article or "")) < MIN_ARTICLE_WORDS:
+        return None, 0.0
+    all_sentences: List[str] = [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+", article.strip()) if sentence.strip()]
+    frequency: Counter = Counter(word for word in words(article) if word not in EXTRACTION_STOP_WORDS)
+    title_words: Set[str] = set(words(title)) - EXTRACTION_STOP_WORDS
+    top: int = max(frequency.values(), default=1)
+    scored: List[Tuple[float, int]] = []
+    for index, sentence in enumerate(all_sentences):
+        sentence_words: List[str] = words(sentence)
+        if not SENTENCE_MIN_WORDS <= len(sentence_words) <= SENTENCE_MAX_WORDS or sentence.endswith("?"):
+            continue
+        content: List[str] = [word for word in sentence_words if word not in EXTRACTION_STOP_WORDS]
+        score: float = sum(frequency[word] / top * (2 if word in title_words else 1) for word in content)
+        scored.append((score / math.sqrt(len(sentence_words)), index))
+    if not scored:
+        return None, 0.0
+    best: List[int] = sorted(index for _, index in sorted(scored, reverse=True)[:sentences])
+    return " ".join(all_sentences[index] for index in best), min(1.0, len(scored) / (2 * sentences))
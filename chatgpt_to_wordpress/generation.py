@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Optional, TypeVar
+from config import generation_concurrency
+
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+def fan_out(
+    items: Iterable[Item],
+    work: Callable[[Item], Result],
+    apply: Callable[[Item, Result], None],
+    max_workers: int = generation_concurrency,
+    prepare: Optional[Callable[[Item], Any]] = None,
+) -> int:
+    """
+    Runs `work` for every item on a bounded thread pool and hands each result to `apply` as soon as it completes.
+
+    `work` runs on the pool and must not touch the database session or ORM objects; for `Trend` rows, pass
+    `prepare` to read the fields `work` needs on the calling thread first. `prepare` and `apply` always run
+    on the calling thread, so `apply` can safely write the result back to the item's `Trend` row.
+    A failure in `prepare`, `work` or `apply` is printed and only skips that item.
+
+    Args:
+        items (Iterable[Item]): The items to process, e.g. `Trend` rows.
+        work (Callable[[Item], Result]): The blocking call to run for each item, e.g. an OpenAI request.
+        apply (Callable[[Item, Result], None]): Stores a finished result for its item.
+        max_workers (int, optional): The maximum number of concurrent calls. Defaults to `generation_concurrency` from the config.
+        prepare (Optional[Callable[[Item], Any]], optional): Turns each item into the payload passed to `work`.
+            Defaults to None, which passes the item itself.
+
+    Returns:
+        int: The number of items whose result was applied.
+    """
+    applied: int = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures: Dict[Any, Item] = {}
+        for item in items:
+            try:
+                futures[pool.submit(work, prepare(item) if prepare is not None else item)] = item
+            except Exception as e:
+                print(e)
+        for future in as_completed(futures):
+            item: Item = futures[future]
+            try:
+                apply(item, future.result())
+                applied += 1
+            except Exception as e:
+                print(e)
+    return applied
@@ -0,0 +1,109 @@
+import importlib
+import os
+from typing import Any, Dict, List
+from config import image_format, image_quality, image_sizes
+from PIL import Image
+
+try:
+    # Registers the AVIF codec on Pillow versions that don't ship it.
+    importlib.import_module("pillow_avif")
+except ImportError:
+    pass
+
+ImageReport = Dict[str, Any]
+
+FORMATS: Dict[str, str] = {"webp": "WEBP", "avif": "AVIF", "jpeg": "JPEG", "jpg": "JPEG", "png": "PNG"}
+EXTENSIONS: Dict[str, str] = {"WEBP": ".webp", "AVIF": ".avif", "JPEG": ".jpg", "PNG": ".png"}
+
+
+def _save(image: Image.Image, path: str, pil_format: str, quality: int) -> None:
+    if pil_format == "JPEG":
+        image.convert("RGB").save(path, "JPEG", quality=quality, optimize=True, progressive=True)
+    elif pil_format == "WEBP":
+        image.save(path, "WEBP", quality=quality, method=6)
+    elif pil_format == "AVIF":
+        image.save(path, "AVIF", quality=quality)
+    else:
+        image.save(path, "PNG", optimize=True)
+
+
+def optimized_filename(filename: str, pil_format: str, width: int = 0) -> str:
+    """
+    Returns where the compressed copy of a generated image is written.
+
+    Args:
+        filename (str): The generated image, e.g. "images/42.png".
+        pil_format (str): The Pillow format name, e.g. "WEBP".
+        width (int, optional): The width of a resized variant, or 0 for the full-size image. Defaults to 0.
+
+    Returns:
+        str: E.g. "images/42.webp", or "images/42-256w.webp" for a variant.
+    """
+    stem: str = os.path.splitext(filename)[0]
+    suffix: str = f"-{width}w" if width else ""
+    return f"{stem}{suffix}{EXTENSIONS[pil_format]}"
+
+
+def optimize_image(filename: str, output_format: str = image_format, quality: int = image_quality, sizes: List[int] = image_sizes) -> ImageReport:
+    """
+    Compresses a generated image for the web and writes resized variants next to it.
+
+    Formats Pillow cannot write on this host (e.g. AVIF without a codec) fall back to optimized JPEG.
+    Outputs that are already newer than the source are kept. Variants wider than the source are skipped.
+
+    Args:
+        filename (str): The generated PNG image.
+        output_format (str, optional): "webp", "avif", "jpeg" or "png". Defaults to `image_format` from the config.
+        quality (int, optional): The encoder quality from 1 to 100. Defaults to `image_quality` from the config.
+        sizes (List[int], optional): Widths of the resized variants. Defaults to `image_sizes` from the config.
+
+    Returns:
+        ImageReport: The "path" of the full-size image to upload, the paths of the "variants", and the
+            "original_bytes" and "bytes" of the full-size image before and after.
+    """
+    pil_format: str = FORMATS.get(output_format, "WEBP")
+    Image.init()
+    if pil_format not in Image.SAVE:
+        print(f"Pillow cannot write {pil_format} here, using JPEG.")
+        pil_format = "JPEG"
+
+    with Image.open(filename) as source:
+        source.load()
+        targets: List[int] = [0] + [int(width) for width in sizes if 0 < int(width) < source.width]
+        paths: List[str] = []
+        for width in targets:
+            path: str = optimized_filename(filename, pil_format, width)
+            if path == filename:
+                paths.append(path)
+                continue
+            if not (os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(filename)):
+                image: Image.Image = source
+                if width:
+                    image = source.resize((width, round(source.height * width / source.width)), Image.LANCZOS)
+                _save(image, path, pil_format, quality)
+            paths.append(path)
+
+    return {
+        "path": paths[0],
+        "variants": paths[1:],
+        "original_bytes": os.path.getsize(filename),
+        "bytes": os.path.getsize(paths[0]),
+    }
+
+
+def format_report(report: ImageReport) -> str:
+    """
+    Describes the savings of one optimized image.
+
+    Args:
+        report (ImageReport): The result of `optimize_image`.
+
+    Returns:
+        str: E.g. "images/42.webp: 402113 -> 38210 bytes (90% smaller), 1 resized variant(s)".
+    """
+    original: int = report["original_bytes"]
+    saved: float = 100 * (original - report["bytes"]) / original if original else 0.0
+    return (
+        f"{report['path']}: {original} -> {report['bytes']} bytes ({saved:.0f}% smaller), "
+        f"{len(report['variants'])} resized variant(s)"
+    )
@@ -0,0 +1,219 @@
+from multiprocessing.connection import Client, Listener
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+from config import image_worker_address, image_worker_authkey, image_batch_size, image_variants
+from PIL import Image
+from metrics import diffusion_seconds
+
+ImageJob = Dict[str, Any]
+Address = Union[str, Tuple[str, int]]
+
+_generator = None
+
+
+def get_generator():
+    """
+    Returns the shared StableDiffusion model, loading it on first use.
+
+    TensorFlow and the model weights are only imported and loaded when an image is actually needed,
+    so stages and tools that never generate images do not pay the startup cost.
+
+    Returns:
+        StableDiffusion: The loaded model.
+    """
+    global _generator
+    if _generator is None:
+        from stable_diffusion_tf.stable_diffusion import StableDiffusion
+        _generator = StableDiffusion(
+            img_height=512,
+            img_width=512,
+            jit_compile=False,
+        )
+    return _generator
+
+
+def variant_filename(filename: str, index: int) -> str:
+    """
+    Returns the filename used for an extra sample of a generated image.
+
+    The first sample is always saved under `filename` itself so the rest of the pipeline
+    can keep treating it as the featured image.
+
+    Args:
+        filename (str): The primary filename, e.g. "images/42.png".
+        index (int): The sample index within the batch.
+
+    Returns:
+        str: `filename` for index 0, otherwise e.g. "images/42_1.png".
+    """
+    if index == 0:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}_{index}{ext}"
+
+
+def default_image_batch_size() -> int:
+    """
+    Picks how many prompts to generate per batch from the host's physical memory.
+
+    Returns:
+        int: `image_batch_size` from the config if set, otherwise one prompt per 4 GiB of RAM (at least 1).
+    """
+    if image_batch_size > 0:
+        return image_batch_size
+    try:
+        total_bytes: int = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 1
+    return max(1, total_bytes // (4 * 1024 ** 3))
+
+
+def generate_images_local(jobs: List[ImageJob], variants: int = image_variants) -> List[List[str]]:
+    """
+    Generates images for a batch of prompts in the current process.
+
+    Every sample returned by the model is written to disk, so no diffusion work is thrown away:
+    with `variants` set to 1 each prompt costs a single sample, and with a higher value the extra
+    samples are kept next to the primary image as candidate featured images.
+
+    Args:
+        jobs (List[ImageJob]): Dictionaries with "prompt" and "filename" keys.
+        variants (int, optional): Samples to generate per prompt. Defaults to `image_variants` from the config.
+
+    Returns:
+        List[List[str]]: The filenames written for each job, primary image first.
+    """
+    generator = get_generator()
+    written: List[List[str]] = []
+    for job in jobs:
+        start: float = time.perf_counter()
+        img = generator.generate(
+            job["prompt"],
+            num_steps=5,
+            unconditional_guidance_scale=2,
+            temperature=1,
+            batch_size=max(1, variants),
+        )
+        for _ in range(len(img)):
+            diffusion_seconds.observe((time.perf_counter() - start) / len(img))
+        filenames: List[str] = []
+        for index, sample in enumerate(img):
+            filename: str = variant_filename(job["filename"], index)
+            Image.fromarray(sample).save(f"{filename}")
+            filenames.append(filename)
+        written.append(filenames)
+    return written
+
+
+def parse_address(address: str) -> Address:
+    """
+    Converts a configured worker address into a form accepted by multiprocessing.connection.
+
+    Args:
+        address (str): Either "host:port" for a TCP socket or a filesystem path for a Unix socket.
+
+    Returns:
+        Address: A (host, port) tuple or the socket path.
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "localhost", int(port))
+    return address
+
+
+def connection_authkey(address: Address, authkey: bytes = image_worker_authkey) -> Optional[bytes]:
+    """
+    Returns the key that authenticates connections to the image worker.
+
+    multiprocessing.connection unpickles whatever it receives, so anyone who can connect to the worker can run
+    code in it. A TCP address is therefore only accepted with an explicitly configured key; a Unix socket is
+    protected by its file permissions and may go without one.
+
+    Args:
+        address (Address): The parsed worker address.
+        authkey (bytes, optional): The shared secret. Defaults to `image_worker_authkey` from the config.
+
+    Returns:
+        Optional[bytes]: The key, or None for a Unix socket without one.
+
+    Raises:
+        ValueError: If the address is a TCP socket and no key is configured.
+    """
+    if authkey:
+        return authkey
+    if isinstance(address, tuple):
+        raise ValueError(f"Refusing to use the image worker on {address[0]}:{address[1]} without an image_worker_authkey.")
+    return None
+
+
+def handle_job(request: ImageJob) -> ImageJob:
+    """
+    Runs a batch of generation jobs received from a client.
+
+    Args:
+        request (ImageJob): A dictionary with a "jobs" list of {"prompt", "filename"} dictionaries and a "variants" count.
+
+    Returns:
+        ImageJob: {"ok": True, "files": [...]} on success, or {"ok": False, "error": message} on failure.
+    """
+    try:
+        files = generate_images_local(request["jobs"], request.get("variants", image_variants))
+        return {"ok": True, "files": files}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+
+def serve(address: str = image_worker_address) -> None:
+    """
+    Runs the image worker, keeping the model warm and serving generation jobs until interrupted.
+
+    Args:
+        address (str, optional): The address to listen on. Defaults to `image_worker_address` from the config.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the address is a TCP socket and no `image_worker_authkey` is configured.
+    """
+    listen_address: Address = parse_address(address)
+    authkey: Optional[bytes] = connection_authkey(listen_address)
+    get_generator()
+    with Listener(listen_address, authkey=authkey) as listener:
+        print(f"Image worker listening on {address}")
+        while True:
+            with listener.accept() as conn:
+                request: ImageJob = conn.recv()
+                print(f"Generating {len(request['jobs'])} image(s)")
+                conn.send(handle_job(request))
+
+
+def request_images(jobs: List[ImageJob], variants: int = image_variants, address: str = image_worker_address) -> Optional[ImageJob]:
+    """
+    Sends a batch of generation jobs to a running image worker and waits for it to finish.
+
+    Args:
+        jobs (List[ImageJob]): Dictionaries with "prompt" and "filename" keys; filenames should be absolute.
+        variants (int, optional): Samples to generate per prompt. Defaults to `image_variants` from the config.
+        address (str, optional): The worker address. Defaults to `image_worker_address` from the config.
+
+    Returns:
+        Optional[ImageJob]: The worker's reply, or None if no worker is reachable.
+
+    Raises:
+        ValueError: If the address is a TCP socket and no `image_worker_authkey` is configured.
+    """
+    worker_address: Address = parse_address(address)
+    authkey: Optional[bytes] = connection_authkey(worker_address)
+    try:
+        conn = Client(worker_address, authkey=authkey)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+    with conn:
+        conn.send({"jobs": jobs, "variants": variants})
+        return conn.recv()
+
+
+if __name__ == '__main__':
+    serve()
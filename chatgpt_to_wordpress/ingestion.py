@@ -0,0 +1,183 @@
+import asyncio
+import praw
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from config import my_client_id, my_client_secret, my_user_agent, my_refresh_token, subreddits, ingestion_batch_size
+from models import SubredditCursor, insert_new_trends, session, trend_key
+from rate_limit import reddit_limiter
+
+
+def get_reddit() -> praw.Reddit:
+    """
+    Creates an authenticated Reddit client from the config.
+
+    Returns:
+        praw.Reddit: The Reddit client.
+    """
+    return praw.Reddit(
+        client_id=my_client_id,
+        client_secret=my_client_secret,
+        user_agent=my_user_agent,
+        refresh_token=my_refresh_token,
+    )
+
+
+def fetch_new_submissions(subreddit: praw.models.Subreddit, last_fullname: Optional[str], last_created_utc: Optional[float], limit: int) -> List[praw.models.Submission]:
+    """
+    Pages through a subreddit's newest submissions until it reaches the stored cursor.
+
+    Listings are fetched lazily, newest first, so a run where nothing new was posted costs a single request.
+    When more than `limit` submissions arrived since the last run, the oldest `limit` of them are returned, so
+    the cursor only moves past submissions that are actually ingested and later runs catch up on the rest.
+    The first run, without a cursor, takes the newest `limit` submissions.
+    This function does not touch the database and can run on a worker thread.
+
+    Args:
+        subreddit (praw.models.Subreddit): The subreddit to poll.
+        last_fullname (Optional[str]): The fullname of the newest submission already ingested, or None on the first run.
+        last_created_utc (Optional[float]): The creation time of that submission, or None on the first run.
+        limit (int): The maximum number of submissions to return.
+
+    Returns:
+        List[praw.models.Submission]: Up to `limit` submissions newer than the cursor, newest first.
+    """
+    first_run: bool = last_fullname is None and last_created_utc is None
+    submissions: List[praw.models.Submission] = []
+    for submission in subreddit.new(limit=limit if first_run else None):
+        if submission.fullname == last_fullname or (last_created_utc is not None and submission.created_utc <= last_created_utc):
+            break
+        submissions.append(submission)
+    return submissions[-limit:] if limit > 0 else submissions
+
+
+def get_cursor(name: str) -> Tuple[Optional[str], Optional[float]]:
+    """
+    Reads the high-water mark of a subreddit.
+
+    Args:
+        name (str): The subreddit name.
+
+    Returns:
+        Tuple[Optional[str], Optional[float]]: The last ingested fullname and its creation time, or (None, None) on the first run.
+    """
+    cursor: Optional[SubredditCursor] = session.get(SubredditCursor, name)
+    if cursor is None:
+        return None, None
+    return cursor.last_fullname, cursor.last_created_utc
+
+
+def store_submissions(name: str, submissions: List[praw.models.Submission], batch_size: int = ingestion_batch_size) -> int:
+    """
+    Adds fetched submissions to the database and advances the subreddit's cursor.
+
+    Rows are inserted and committed in batches of `batch_size`. The cursor is only advanced with the
+    last batch, so an interrupted run fetches the same submissions again and the unique
+    `trend_key` index drops the ones already stored.
+
+    Args:
+        name (str): The subreddit name.
+        submissions (List[praw.models.Submission]): Submissions from `fetch_new_submissions`, newest first.
+        batch_size (int, optional): Rows per commit. Defaults to `ingestion_batch_size` from the config.
+
+    Returns:
+        int: The number of trends added.
+    """
+    if not submissions:
+        print(f"No new submissions in r/{name}.")
+        return 0
+
+    added: int = 0
+    for start in range(0, len(submissions), batch_size):
+        rows: List[Dict[str, Any]] = [
+            {
+                "trend_name": submission.title,
+                "trend_key": trend_key(submission.title),
+                "timestamp": f"{datetime.now()}:process_reddit_trends_01",
+            }
+            for submission in submissions[start:start + batch_size]
+        ]
+        added += insert_new_trends(rows)
+        if start + batch_size >= len(submissions):
+            cursor: Optional[SubredditCursor] = session.get(SubredditCursor, name)
+            if cursor is None:
+                cursor = SubredditCursor(subreddit=name)
+                session.add(cursor)
+            cursor.last_fullname = submissions[0].fullname
+            cursor.last_created_utc = submissions[0].created_utc
+            cursor.timestamp = f"{datetime.now()}:process_reddit_trends_01"
+        session.commit()
+
+    print(f"Added {added} of {len(submissions)} new submissions from r/{name} to the database.")
+    return added
+
+
+def ingest_subreddit(reddit: praw.Reddit, name: str, num_trends: int, batch_size: int = ingestion_batch_size) -> int:
+    """
+    Adds submissions posted to a subreddit since the last run to the database.
+
+    Args:
+        reddit (praw.Reddit): The Reddit client.
+        name (str): The subreddit name, e.g. "ChatGPT".
+        num_trends (int): The maximum number of submissions to fetch.
+        batch_size (int, optional): Rows per commit. Defaults to `ingestion_batch_size` from the config.
+
+    Returns:
+        int: The number of trends added.
+    """
+    last_fullname, last_created_utc = get_cursor(name)
+    submissions: List[praw.models.Submission] = reddit_limiter.call(
+        fetch_new_submissions, reddit.subreddit(name), last_fullname, last_created_utc, num_trends
+    )
+    return store_submissions(name, submissions, batch_size)
+
+
+def ingest_subreddits(num_trends: int, names: List[str] = subreddits) -> int:
+    """
+    Runs `ingest_subreddit` for every configured subreddit.
+
+    Args:
+        num_trends (int): The maximum number of submissions to fetch per subreddit.
+        names (List[str], optional): The subreddits to follow. Defaults to `subreddits` from the config.
+
+    Returns:
+        int: The total number of trends added.
+    """
+    reddit: praw.Reddit = get_reddit()
+    added: int = 0
+    for name in names:
+        try:
+            added += ingest_subreddit(reddit, name, num_trends)
+        except Exception as e:
+            session.rollback()
+            print(f"Error ingesting r/{name}: {e}")
+    return added
+
+
+async def ingest_subreddits_async(reddit: praw.Reddit, num_trends: int, names: List[str] = subreddits) -> int:
+    """
+    Like `ingest_subreddits`, but fetches from Reddit on a worker thread so a running event loop is not blocked.
+
+    The database work stays on the calling (event loop) thread.
+
+    Args:
+        reddit (praw.Reddit): A Reddit client kept open between calls.
+        num_trends (int): The maximum number of submissions to fetch per subreddit.
+        names (List[str], optional): The subreddits to follow. Defaults to `subreddits` from the config.
+
+    Returns:
+        int: The total number of trends added.
+    """
+    loop = asyncio.get_event_loop()
+    added: int = 0
+    for name in names:
+        try:
+            last_fullname, last_created_utc = get_cursor(name)
+            submissions: List[praw.models.Submission] = await loop.run_in_executor(
+                None,
+                lambda: reddit_limiter.call(fetch_new_submissions, reddit.subreddit(name), last_fullname, last_created_utc, num_trends),
+            )
+            added += store_submissions(name, submissions)
+        except Exception as e:
+            session.rollback()
+            print(f"Error ingesting r/{name}: {e}")
+    return added
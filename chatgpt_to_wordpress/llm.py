@@ -0,0 +1,368 @@
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from config import (
+    batch_completion_window,
+    batch_poll_interval,
+    generation_backend,
+    generation_concurrency,
+    generation_model,
+    local_llm_fields,
+    local_llm_model,
+    openai_base_url,
+    openai_timeout,
+    openapi_key,
+)
+from local_llm import LocalBackend
+from metrics import openai_tokens
+from rate_limit import estimate_tokens, openai_limiter
+
+# (custom id, prompt, max tokens, temperature) of one request in a batch job.
+BatchRequest = Tuple[str, str, int, float]
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+BATCH_STATE_PATH: str = os.path.join('data', 'batches')
+
+
+def count_usage(response: Dict[str, Any]) -> None:
+    # Streams carry no usage, so only whole responses and batch results are counted.
+    usage: Dict[str, int] = response.get("usage") or {}
+    for kind in ("prompt", "completion"):
+        if usage.get(f"{kind}_tokens"):
+            openai_tokens.inc(usage[f"{kind}_tokens"], kind=kind)
+
+
+class OpenAIClient:
+    """
+    A keep-alive client for the OpenAI REST API, or any server that implements the same endpoints.
+
+    All requests share one `requests.Session` with a connection pool, carry the API key from the
+    config and go through the OpenAI rate limiter.
+
+    Args:
+        base_url (str, optional): The API root, e.g. "https://api.openai.com/v1". Defaults to `openai_base_url` from the config.
+        api_key (str, optional): The bearer token. Defaults to `openapi_key` from the config.
+        timeout (float, optional): Seconds to wait for a connection or response. Defaults to `openai_timeout` from the config.
+        pool_size (int, optional): Connections kept open to the host. Defaults to `generation_concurrency` from the config.
+    """
+
+    def __init__(
+        self,
+        base_url: str = openai_base_url,
+        api_key: str = openapi_key,
+        timeout: float = openai_timeout,
+        pool_size: int = generation_concurrency,
+    ) -> None:
+        self.base_url: str = base_url.rstrip("/")
+        self.timeout: float = timeout
+        self.session: requests.Session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=max(1, pool_size))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, path: str, tokens: float = 0, **kwargs: Any) -> requests.Response:
+        """
+        Sends a request through the pooled session and the OpenAI rate limiter.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The endpoint path below the API root, e.g. "chat/completions".
+            tokens (float, optional): The estimated model tokens the request consumes. Defaults to 0.
+            **kwargs (Any): Arguments for `requests.Session.request`, e.g. `json`, `data` or `files`.
+
+        Returns:
+            requests.Response: The response.
+
+        Raises:
+            RuntimeError: If the server answered with an error status.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        response: requests.Response = openai_limiter.call(
+            self.session.request, method, f"{self.base_url}/{path}", tokens=tokens, **kwargs
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(f"OpenAI {method} {path} failed: {response.status_code} {response.text[:200]}")
+        return response
+
+
+class CompletionBackend:
+    """
+    Generates text with the legacy completions endpoint, one prompt per request.
+
+    Args:
+        client (OpenAIClient): The API client.
+        model (str, optional): The model name. Defaults to "text-davinci-003".
+    """
+
+    endpoint: str = "completions"
+    default_model: str = "text-davinci-003"
+
+    def __init__(self, client: OpenAIClient, model: str = "") -> None:
+        self.client: OpenAIClient = client
+        self.model: str = model or self.default_model
+
+    def body(self, prompt: str, max_tokens: int, temperature: float, prefix: str = "") -> Dict[str, Any]:
+        # The legacy endpoint simply continues the text, so a partial answer resumes by appending it to the prompt.
+        return {"model": self.model, "prompt": prompt + prefix, "max_tokens": max_tokens, "n": 1, "temperature": temperature}
+
+    def text(self, response: Dict[str, Any]) -> str:
+        return response["choices"][0]["text"].strip()
+
+    def delta(self, chunk: Dict[str, Any]) -> str:
+        return chunk["choices"][0].get("text") or "" if chunk.get("choices") else ""
+
+    def complete(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> str:
+        """
+        Sends one prompt and waits for its completion.
+
+        Args:
+            prompt (str): The prompt to complete.
+            max_tokens (int): The maximum number of tokens to generate.
+            temperature (float, optional): The sampling temperature. Defaults to 0.7.
+
+        Returns:
+            str: The generated text, stripped of surrounding whitespace.
+        """
+        response: requests.Response = self.client.request(
+            "POST", self.endpoint, tokens=estimate_tokens(prompt, max_tokens), json=self.body(prompt, max_tokens, temperature)
+        )
+        body: Dict[str, Any] = response.json()
+        count_usage(body)
+        return self.text(body)
+
+    def stream(self, prompt: str, max_tokens: int, temperature: float = 0.7, prefix: str = "") -> Iterator[str]:
+        """
+        Sends one prompt with streaming enabled and yields the text as it is generated.
+
+        Args:
+            prompt (str): The prompt to complete.
+            max_tokens (int): The maximum number of tokens to generate after `prefix`.
+            temperature (float, optional): The sampling temperature. Defaults to 0.7.
+            prefix (str, optional): The start of the answer from an interrupted request, to be continued. Defaults to "".
+
+        Yields:
+            str: The pieces of generated text, unstripped and in order.
+
+        Raises:
+            RuntimeError: If the stream ended without the final "[DONE]" event.
+        """
+        body: Dict[str, Any] = {**self.body(prompt, max_tokens, temperature, prefix), "stream": True}
+        response: requests.Response = self.client.request(
+            "POST", self.endpoint, tokens=estimate_tokens(prompt + prefix, max_tokens), json=body, stream=True
+        )
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data: str = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                piece: str = self.delta(json.loads(data))
+                if piece:
+                    yield piece
+        raise RuntimeError(f"The {self.endpoint} stream ended before it was done.")
+
+
+class ChatBackend(CompletionBackend):
+    """
+    Generates text with the chat completions endpoint, sending each prompt as a single user message.
+
+    Args:
+        client (OpenAIClient): The API client.
+        model (str, optional): The model name. Defaults to "gpt-3.5-turbo".
+    """
+
+    endpoint: str = "chat/completions"
+    default_model: str = "gpt-3.5-turbo"
+
+    def body(self, prompt: str, max_tokens: int, temperature: float, prefix: str = "") -> Dict[str, Any]:
+        messages: List[Dict[str, str]] = [{"role": "user", "content": prompt}]
+        if prefix:
+            messages += [
+                {"role": "assistant", "content": prefix},
+                {"role": "user", "content": "Continue exactly where your answer stopped, without repeating any of it."},
+            ]
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "n": 1,
+            "temperature": temperature,
+        }
+
+    def text(self, response: Dict[str, Any]) -> str:
+        return (response["choices"][0]["message"].get("content") or "").strip()
+
+    def delta(self, chunk: Dict[str, Any]) -> str:
+        return chunk["choices"][0].get("delta", {}).get("content") or "" if chunk.get("choices") else ""
+
+
+BACKENDS: Dict[str, type] = {"completion": CompletionBackend, "chat": ChatBackend}
+Backend = Union[CompletionBackend, LocalBackend]
+_backend: Optional[CompletionBackend] = None
+_local_backend: Optional[LocalBackend] = None
+# Stage threads ask for the backends at the same time; only one of them may create each.
+_backend_lock = threading.Lock()
+
+
+def is_local(field: str) -> bool:
+    """
+    Tells whether a field is generated by the local model instead of the API.
+
+    Args:
+        field (str): "title", "content", "tags" or "excerpt".
+
+    Returns:
+        bool: True if `local_llm_model` is set and `local_llm_fields` lists the field.
+    """
+    return bool(local_llm_model) and field in local_llm_fields
+
+
+def get_backend(field: str = "") -> Backend:
+    """
+    Returns the backend that generates a field, creating it on first use.
+
+    Fields listed in `local_llm_fields` go to the local model when `local_llm_model` is set; everything else
+    goes to the API backend selected by `generation_backend` and `generation_model` in the config.
+
+    Args:
+        field (str, optional): "title", "content", "tags" or "excerpt", or "" for prompts that are always sent to the API. Defaults to "".
+
+    Returns:
+        Backend: The shared backend.
+
+    Raises:
+        ValueError: If `generation_backend` names no known backend.
+    """
+    global _backend, _local_backend
+    with _backend_lock:
+        if is_local(field):
+            if _local_backend is None:
+                _local_backend = LocalBackend()
+            return _local_backend
+        if _backend is None:
+            if generation_backend not in BACKENDS:
+                raise ValueError(f"Unknown generation_backend {generation_backend!r}, expected one of {', '.join(BACKENDS)}.")
+            _backend = BACKENDS[generation_backend](OpenAIClient(), generation_model)
+        return _backend
+
+
+def submit_batch(backend: CompletionBackend, batch: List[BatchRequest]) -> str:
+    """
+    Uploads prompts as a JSONL file and starts a batch job that completes them offline.
+
+    Args:
+        backend (CompletionBackend): Decides the endpoint, model and request bodies.
+        batch (List[BatchRequest]): The requests; custom ids must be unique.
+
+    Returns:
+        str: The batch job's ID.
+    """
+    lines: str = "".join(
+        json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": f"/v1/{backend.endpoint}",
+            "body": backend.body(prompt, max_tokens, temperature),
+        }, ensure_ascii=False) + "\n"
+        for custom_id, prompt, max_tokens, temperature in batch
+    )
+    upload: requests.Response = backend.client.request(
+        "POST", "files", data={"purpose": "batch"}, files={"file": ("batch.jsonl", lines.encode("utf-8"), "application/jsonl")}
+    )
+    job: requests.Response = backend.client.request("POST", "batches", json={
+        "input_file_id": upload.json()["id"],
+        "endpoint": f"/v1/{backend.endpoint}",
+        "completion_window": batch_completion_window,
+    })
+    return job.json()["id"]
+
+
+def wait_for_batch(backend: CompletionBackend, batch_id: str, poll_interval: float = batch_poll_interval) -> Dict[str, Any]:
+    """
+    Polls a batch job until it has finished.
+
+    Args:
+        backend (CompletionBackend): The backend the job was submitted with.
+        batch_id (str): The batch job's ID.
+        poll_interval (float, optional): Seconds between polls. Defaults to `batch_poll_interval` from the config.
+
+    Returns:
+        Dict[str, Any]: The final batch object.
+    """
+    while True:
+        job: Dict[str, Any] = backend.client.request("GET", f"batches/{batch_id}").json()
+        counts: Dict[str, int] = job.get("request_counts") or {}
+        print(f"Batch {batch_id}: {job['status']} ({counts.get('completed', 0)}/{counts.get('total', '?')} done)")
+        if job["status"] in BATCH_FINAL_STATUSES:
+            return job
+        time.sleep(poll_interval)
+
+
+def batch_results(backend: CompletionBackend, job: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """
+    Downloads the completions of a finished batch job.
+
+    Args:
+        backend (CompletionBackend): The backend the job was submitted with.
+        job (Dict[str, Any]): The final batch object from `wait_for_batch`.
+
+    Returns:
+        Dict[str, Optional[str]]: The generated text by custom id; None for requests that failed.
+    """
+    results: Dict[str, Optional[str]] = {}
+    for key in ("output_file_id", "error_file_id"):
+        if not job.get(key):
+            continue
+        content: str = backend.client.request("GET", f"files/{job[key]}/content").text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            record: Dict[str, Any] = json.loads(line)
+            response: Dict[str, Any] = record.get("response") or {}
+            if response.get("status_code") == 200 and response.get("body"):
+                count_usage(response["body"])
+                results[record["custom_id"]] = backend.text(response["body"])
+            else:
+                results.setdefault(record["custom_id"], None)
+    return results
+
+
+def run_batch(name: str, batch: List[BatchRequest], backend: Optional[CompletionBackend] = None) -> Dict[str, Optional[str]]:
+    """
+    Completes prompts with one batch job and waits for the results.
+
+    The job's ID is kept in "data/batches/<name>.json" until its results are downloaded, so a run that
+    is interrupted while waiting picks up the same job instead of submitting and paying for it again.
+
+    Args:
+        name (str): Identifies the job across runs, e.g. the stage name.
+        batch (List[BatchRequest]): The requests to submit if no job is in flight.
+        backend (Optional[CompletionBackend], optional): Defaults to the backend from `get_backend`.
+
+    Returns:
+        Dict[str, Optional[str]]: The generated text by custom id; None for requests that failed.
+    """
+    backend = backend or get_backend()
+    path: str = os.path.join(BATCH_STATE_PATH, f"{name}.json")
+    if os.path.exists(path):
+        with open(path, 'r') as state_file:
+            batch_id: str = json.load(state_file)["id"]
+        print(f"Resuming {name} batch {batch_id}.")
+    elif batch:
+        batch_id = submit_batch(backend, batch)
+        os.makedirs(BATCH_STATE_PATH, exist_ok=True)
+        with open(path, 'w') as state_file:
+            json.dump({"id": batch_id, "requests": len(batch)}, state_file)
+        print(f"Submitted {name} batch {batch_id} with {len(batch)} request(s).")
+    else:
+        return {}
+
+    job: Dict[str, Any] = wait_for_batch(backend, batch_id)
+    results: Dict[str, Optional[str]] = batch_results(backend, job)
+    os.remove(path)
+    return results
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional
+from config import local_llm_context, local_llm_model, local_llm_threads, local_llm_workers
+
+_model = None
+
+
+def _load_model(model_path: str, context: int, threads: int) -> None:
+    # Runs once in every worker process, so each process keeps its own copy of the model in memory.
+    global _model
+    from llama_cpp import Llama
+    _model = Llama(model_path=model_path, n_ctx=context, n_threads=threads or None, verbose=False)
+
+
+def _complete(prompt: str, max_tokens: int, temperature: float) -> str:
+    response: Any = _model.create_chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    return (response["choices"][0]["message"].get("content") or "").strip()
+
+
+class LocalBackend:
+    """
+    Generates text with a quantized GGUF model on the CPU through llama-cpp-python.
+
+    Prompts run on a pool of worker processes that each load the model once, so concurrent calls
+    from the stage threads are generated in parallel without network round trips or per-token cost.
+    `llama_cpp` is only imported in the workers, when the first prompt is sent.
+
+    Args:
+        model_path (str, optional): The GGUF file. Defaults to `local_llm_model` from the config.
+        workers (int, optional): Worker processes, each with its own copy of the model. Defaults to `local_llm_workers` from the config.
+        threads (int, optional): CPU threads per worker, or 0 to let llama.cpp decide. Defaults to `local_llm_threads` from the config.
+        context (int, optional): The context window in tokens. Defaults to `local_llm_context` from the config.
+    """
+
+    def __init__(
+        self,
+        model_path: str = local_llm_model,
+        workers: int = local_llm_workers,
+        threads: int = local_llm_threads,
+        context: int = local_llm_context,
+    ) -> None:
+        self.model: str = os.path.basename(model_path)
+        self.model_path: str = model_path
+        self.workers: int = max(1, workers)
+        self.threads: int = threads
+        self.context: int = context
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Stage threads ask for the pool at the same time; only one of them may start the worker processes.
+        with self.lock:
+            if self.pool is None:
+                # Forking a process that already runs stage threads can deadlock; start clean interpreters instead.
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_load_model,
+                    initargs=(self.model_path, self.context, self.threads),
+                )
+            return self.pool
+
+    def complete(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> str:
+        """
+        Generates the answer to one prompt on a worker process and waits for it.
+
+        Args:
+            prompt (str): The prompt, sent as a single user message with the model's chat template.
+            max_tokens (int): The maximum number of tokens to generate.
+            temperature (float, optional): The sampling temperature. Defaults to 0.7.
+
+        Returns:
+            str: The generated text, stripped of surrounding whitespace.
+        """
+        return self._pool().submit(_complete, prompt, max_tokens, temperature).result()
+
+    def complete_many(self, prompts: List[str], max_tokens: int, temperature: float = 0.7) -> List[str]:
+        """
+        Generates the answers to several prompts, spread over all worker processes.
+
+        Args:
+            prompts (List[str]): The prompts.
+            max_tokens (int): The maximum number of tokens to generate for each prompt.
+            temperature (float, optional): The sampling temperature. Defaults to 0.7.
+
+        Returns:
+            List[str]: The generated texts, in the order of `prompts`.
+        """
+        count: int = len(prompts)
+        return list(self._pool().map(_complete, prompts, [max_tokens] * count, [temperature] * count))
+
+    def close(self) -> None:
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
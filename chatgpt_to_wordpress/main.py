@@ -1,19 +1,30 @@
-import base64
-import praw
-from models import Trend, session
-from typing import Any, Dict, List, NoReturn, Union
-from config import my_client_id, my_client_secret, my_user_agent, my_refresh_token, openapi_key, application_password, api_base_url, username, tags_url, auth_header
+import argparse
+from models import Trend, TrendState, WordPressTag, save_draft, session
+from typing import Any, Callable, Dict, List, NoReturn, Tuple, Union
 from typing import Optional
-import openai
-openai.api_key = openapi_key
-from sqlalchemy import and_
+from sqlalchemy import and_, false, or_
+from sqlalchemy.orm import Query, object_session, selectinload
 import os
 import requests
-AuthHeader = Dict[str, str]
 PostData = Dict[str, Union[str, Any]]
-APIResponse = Union[Dict[str, Any], None]
-from stable_diffusion_tf.stable_diffusion import StableDiffusion
-from PIL import Image
+from config import daemon_interval, generation_concurrency, image_worker_address, publish_mode, stage_concurrency
+from completion_cache import CompletionCache, get_cache
+from generation import fan_out
+from ingestion import get_reddit, ingest_subreddits, ingest_subreddits_async
+from pipeline import Stage, run_daemon, run_pipeline
+from tag_index import ensure_tag_ids, refresh_tag_index
+from unit_of_work import UnitOfWork
+from media import lookup_media, record_media, stream_upload, upload_media_files
+from llm import BatchRequest, LocalBackend, get_backend, is_local, run_batch
+from wordpress import wordpress
+from image_worker import ImageJob, default_image_batch_size, generate_images_local, request_images
+from image_processing import ImageReport, format_report, optimize_image
+from dedup import DedupResult, NearDuplicateIndex
+from extraction import Extraction, extract_excerpt, extract_tags
+from metrics import start_metrics
+from config import dedup_window, extraction_batch_size, extraction_min_confidence, generation_mode, local_extraction, stream_articles, stream_checkpoint_chars, stream_opening_paragraphs
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
 
 
 def get_all_trends_in_db() -> List[str]:
@@ -38,35 +49,183 @@ from datetime import datetime
 
 def process_reddit_trends_01(num_trends:int=1) -> None:
     """
-    Process the latest trends from the ChatGPT subreddit on Reddit and add them to the database.
+    Process the latest trends from the configured subreddits on Reddit and add them to the database.
+
+    Each subreddit keeps a cursor of the newest submission already seen, so only newer submissions are
+    fetched. Rows are inserted in batches and titles already in the database are skipped by the
+    unique `trend_key` index.
 
     Args:
-        session: A SQLAlchemy session object.
-        num_trends: The number of latest trends to process (default: 1).
+        num_trends: The maximum number of new trends to process per subreddit (default: 1).
 
     Returns:
         None.
     """
-    reddit: praw.Reddit = praw.Reddit(
-        client_id=my_client_id,
-        client_secret=my_client_secret,
-        user_agent=my_user_agent,
-        refresh_token=my_refresh_token,
+    ingest_subreddits(num_trends)
+
+    return None
+
+
+# The state each stage moves a trend to, and the order of the stages for trends with and without a WordPress draft.
+STAGE_STATES: Dict[str, str] = {
+    "dedup": TrendState.UNIQUE,
+    "title": TrendState.TITLED,
+    "creation": TrendState.CREATED,
+    "content": TrendState.WRITTEN,
+    "update": TrendState.UPDATED,
+    "tags": TrendState.TAGGED,
+    "tags_added": TrendState.TAGS_ADDED,
+    "excerpt": TrendState.EXCERPTED,
+    "excerpt_added": TrendState.EXCERPT_ADDED,
+    "image": TrendState.IMAGED,
+    "optimize": TrendState.OPTIMIZED,
+    "featured_image": TrendState.PUBLISHED,
+    "publish": TrendState.PUBLISHED,
+}
+STAGE_CHAINS: Dict[str, List[str]] = {
+    "single": ["dedup", "title", "content", "tags", "excerpt", "image", "optimize", "publish"],
+    "staged": ["dedup", "title", "creation", "content", "update", "tags", "tags_added", "excerpt", "excerpt_added", "image", "optimize", "featured_image"],
+}
+
+def stage_input_states(stage: str, has_draft: bool = False) -> List[str]:
+    """
+    Returns the pipeline states a stage picks trends up from.
+
+    Trends that already have a WordPress draft (an `article_id`) always finish through the staged chain,
+    whatever the configured `publish_mode`, since publishing them in one request would create a second post.
+    Other trends follow the single-request chain, except that with `publish_mode` "staged" a titled trend
+    gets its draft created next instead of its content written.
+
+    Args:
+        stage (str): A key of `STAGE_STATES`, e.g. "content".
+        has_draft (bool, optional): Whether the states are for trends with an `article_id`. Defaults to False.
+
+    Returns:
+        List[str]: The `Trend.pipeline_state` values the stage consumes, or an empty list if the stage never
+            handles these trends.
+    """
+    if stage == "creation":
+        return [TrendState.TITLED] if not has_draft and publish_mode == "staged" else []
+    chain: List[str] = STAGE_CHAINS["staged" if has_draft else "single"]
+    if stage not in chain or (stage == "content" and not has_draft and publish_mode == "staged"):
+        return []
+    position: int = chain.index(stage)
+    return [STAGE_STATES[chain[position - 1]]] if position else [TrendState.NEW]
+
+def trends_in_stage(stage: str, with_article: bool = False) -> Query:
+    """
+    Queries the trends waiting for a stage through the index on `Trend.pipeline_state`.
+
+    Article bodies live in `trend_contents` and are only read by stages that send them to WordPress.
+
+    Args:
+        stage (str): A key of `STAGE_STATES`.
+        with_article (bool, optional): Load `Trend.article` for all returned trends in one extra query. Defaults to False.
+
+    Returns:
+        Query: The trends the stage still has to process.
+    """
+    draft_states: List[str] = stage_input_states(stage, has_draft=True)
+    states: List[str] = stage_input_states(stage)
+    if draft_states == states:
+        query: Query = session.query(Trend).filter(Trend.pipeline_state.in_(states))
+    else:
+        conditions: List[Any] = []
+        if draft_states:
+            conditions.append(and_(Trend.article_id.isnot(None), Trend.pipeline_state.in_(draft_states)))
+        if states:
+            conditions.append(and_(Trend.article_id.is_(None), Trend.pipeline_state.in_(states)))
+        query = session.query(Trend).filter(or_(*conditions) if conditions else false())
+    if with_article:
+        query = query.options(selectinload(Trend.content))
+    return query
+
+def advance(trend: Trend, stage: str) -> None:
+    trend.pipeline_state = STAGE_STATES[stage]
+
+
+def trends_pending_dedup() -> Query:
+    return trends_in_stage("dedup")
+
+def load_dedup_index(window: int = dedup_window) -> NearDuplicateIndex:
+    """
+    Builds the near-duplicate index from the most recent trends that already passed the check.
+
+    Args:
+        window (int, optional): How many recent trends to index. Defaults to `dedup_window` from the config.
+
+    Returns:
+        NearDuplicateIndex: The index.
+    """
+    index: NearDuplicateIndex = NearDuplicateIndex(window)
+    recent: List[Tuple[int, str]] = (
+        session.query(Trend.id, Trend.trend_name)
+        .filter(Trend.pipeline_state.notin_([TrendState.NEW, TrendState.DUPLICATE]))
+        .order_by(Trend.id.desc())
+        .limit(window)
+        .all()
     )
+    index.check(list(reversed(recent)))
+    return index
 
-    ChatGPT: praw.models.Subreddit = reddit.subreddit('ChatGPT')
-    hot_ChatGPT: List[praw.models.Submission] = list(ChatGPT.new(limit=num_trends))
+def apply_dedup(trend: Trend, duplicate: DedupResult) -> None:
+    if duplicate is None:
+        advance(trend, "dedup")
+        return None
+    original_id, similarity = duplicate
+    trend.pipeline_state = TrendState.DUPLICATE
+    print(f"Skipping trend {trend.id} ({trend.trend_name}), a near duplicate of trend {original_id} (similarity {similarity:.2f}).")
 
-    with session.begin_nested():
-        for submission in hot_ChatGPT:
-            if submission.title not in get_all_trends_in_db():
-                session.add(Trend(trend_name=submission.title, timestamp=f"{datetime.now()}:process_reddit_trends_01"))
-                print(f"Added {submission.title} to the database.")
-                session.commit()
-            else:
-                print(f"{submission.title} already exists in the database.")
+def process_near_duplicates_01b() -> None:
+    """
+    Skips new trends that are near duplicates of recent ones, before any OpenAI or StableDiffusion work is spent on them.
 
-    return None
+    Every trend name is turned into a hashed word and character-trigram vector and compared with the vectors of the
+    `dedup_window` most recent trends. Trends at or above `dedup_threshold` cosine similarity are marked as duplicates.
+
+    Returns:
+        None
+    """
+    index: NearDuplicateIndex = load_dedup_index()
+    with UnitOfWork() as unit:
+        trends: List[Trend] = unit.query(trends_pending_dedup()).order_by(Trend.id).all()
+        results: List[DedupResult] = index.check([(trend.id, trend.trend_name) for trend in trends])
+        apply: Callable[[Trend, Any], None] = unit.applier(apply_dedup)
+        for trend, result in zip(trends, results):
+            apply(trend, result)
+
+
+# A prompt and the maximum number of tokens to generate for it.
+Prompt = Tuple[str, int]
+
+def complete(prompt: str, max_tokens: int, temperature: float = 0.7, use_cache: bool = True, field: str = "") -> str:
+    """
+    Sends a prompt to the configured generation backend (see `llm.get_backend`) within the OpenAI rate limits.
+
+    Completions are looked up in and stored to the persistent completion cache, so replaying a
+    stage or repeating a prompt does not pay for the same request twice.
+
+    Args:
+        prompt (str): The prompt to complete.
+        max_tokens (int): The maximum number of tokens to generate.
+        temperature (float, optional): The sampling temperature. Defaults to 0.7.
+        use_cache (bool, optional): Set to False to bypass the completion cache. Defaults to True.
+        field (str, optional): The field being generated, which may route the prompt to the local model (see `llm.is_local`). Defaults to "".
+
+    Returns:
+        str: The generated text, stripped of surrounding whitespace.
+    """
+    cache: Optional[CompletionCache] = get_cache() if use_cache else None
+    key: str = CompletionCache.key(get_backend(field).model, prompt, max_tokens, temperature)
+    if cache is not None:
+        cached: Optional[str] = cache.get(key)
+        if cached is not None:
+            return cached
+
+    only_choice: str = get_backend(field).complete(prompt, max_tokens, temperature)
+    if cache is not None and only_choice:
+        cache.put(key, only_choice)
+    return only_choice
 
 
 def generate_article_title(keyword: str) -> Optional[str]:
@@ -79,43 +238,185 @@ def generate_article_title(keyword: str) -> Optional[str]:
     Returns:
         Optional[str]: The generated title, or None if no title was generated.
     """
-    prompt: str = f"Generate a title for an article about {keyword}."
-    response: openai.Completion = openai.Completion.create(
-        engine="text-davinci-003",
-        prompt=prompt,
-        max_tokens=30,
-        n=1,
-        stop=None,
-        temperature=0.7,
-    )
-    only_choice = response.choices[0].text.strip()
+    only_choice: str = complete(*title_prompt(keyword), field="title")
     return only_choice if only_choice else None
 
+def title_prompt(keyword: str) -> Prompt:
+    return f"Generate a title for an article about {keyword}.", 30
+
+
+ARTICLE_FIELDS: Tuple[str, ...] = ("title", "article", "tags", "excerpt")
+ArticleFields = Dict[str, Optional[str]]
+
+def parse_article_fields(text: str) -> ArticleFields:
+    """
+    Extracts the fields of a combined generation response, ignoring any text around the JSON object.
+
+    Tags may be given as a list or as a comma separated string. A field that is missing, empty or not text is None.
+
+    Args:
+        text (str): The completion.
+
+    Returns:
+        ArticleFields: "title", "article", "tags" and "excerpt", each a stripped string or None.
+    """
+    fields: ArticleFields = dict.fromkeys(ARTICLE_FIELDS)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return fields
+    try:
+        data: Any = json.loads(text[start:end + 1])
+    except ValueError:
+        return fields
+    if not isinstance(data, dict):
+        return fields
+    for key in ARTICLE_FIELDS:
+        value: Any = data.get(key)
+        if isinstance(value, list):
+            value = ", ".join(str(item).strip() for item in value if str(item).strip())
+        if isinstance(value, str) and value.strip():
+            fields[key] = value.strip()
+    return fields
+
+def generate_article_fields(keyword: str) -> ArticleFields:
+    """
+    Generates the title, article, tags and excerpt for a keyword with a single completion.
+
+    The title falls back to `generate_article_title` if it could not be parsed; the other missing
+    fields are generated one by one by their own stages, which reuse the fields that were parsed.
+
+    Args:
+        keyword (str): The keyword to write about.
+
+    Returns:
+        ArticleFields: "title", "article", "tags" and "excerpt", each a string or None.
+    """
+    fields: ArticleFields = parse_article_fields(complete(*article_fields_prompt(keyword)))
+    missing: List[str] = [key for key in ARTICLE_FIELDS if fields[key] is None]
+    if missing:
+        print(f"Combined generation for {keyword} is missing {', '.join(missing)}, generating them separately.")
+    if fields["title"] is None:
+        fields["title"] = generate_article_title(keyword)
+    return fields
+
+def article_fields_prompt(keyword: str) -> Prompt:
+    prompt: str = (
+        f"Write an article about {keyword}. Respond with only a JSON object with these keys: "
+        '"title": a title for the article, '
+        '"article": the article with 4 paragraphs and a call to action, '
+        '"tags": ten comma separated tags without hashes, '
+        '"excerpt": a two sentence synopsis of the article.'
+    )
+    return prompt, 1200
+
+def reuse_or_generate(generate: Callable[[str], Optional[str]]) -> Callable[[Tuple[Any, ...]], Optional[str]]:
+    """
+    Wraps a field generator so a value already filled in by combined generation is kept instead of generated again.
+
+    Args:
+        generate (Callable[[str], Optional[str]]): E.g. `generate_article_content`.
+
+    Returns:
+        Callable[[Tuple[Any, ...]], Optional[str]]: A function of (keyword, existing value, ...).
+    """
+    def work(payload: Tuple[Any, ...]) -> Optional[str]:
+        keyword, existing = payload[:2]
+        return existing if existing else generate(keyword)
+    return work
+
+# (title, value filled in earlier, article) of a trend whose tags or excerpt are extracted locally.
+ExtractionPayload = Tuple[str, Optional[str], Optional[str]]
+
+def extract_or_generate(
+    extract: Callable[[List[ExtractionPayload]], List[Extraction]],
+    generate: Callable[[str], Optional[str]],
+) -> Callable[[List[ExtractionPayload]], List[Optional[str]]]:
+    """
+    Wraps a local extractor so it runs over a whole batch of trends and falls back to a field generator.
+
+    Values filled in earlier are kept; extractions below `extraction_min_confidence` are generated
+    concurrently from the title instead.
+
+    Args:
+        extract (Callable[[List[ExtractionPayload]], List[Extraction]]): E.g. `extract_article_tags`.
+        generate (Callable[[str], Optional[str]]): E.g. `generate_article_tags`.
+
+    Returns:
+        Callable[[List[ExtractionPayload]], List[Optional[str]]]: A batch `work` function for a `Stage`.
+    """
+    def work(payloads: List[ExtractionPayload]) -> List[Optional[str]]:
+        results: List[Optional[str]] = [existing for _, existing, _ in payloads]
+        todo: List[int] = [index for index, (_, existing, _) in enumerate(payloads) if not existing]
+        fallback: List[int] = []
+        for index, (text, confidence) in zip(todo, extract([payloads[index] for index in todo])):
+            if text and confidence >= extraction_min_confidence:
+                results[index] = text
+            else:
+                fallback.append(index)
+
+        def generate_title(index: int) -> Optional[str]:
+            try:
+                return generate(payloads[index][0])
+            except Exception as e:
+                print(e)
+                return None
+
+        if fallback:
+            print(f"Extraction confidence too low for {len(fallback)} of {len(todo)} trend(s), generating them instead.")
+            with ThreadPoolExecutor(max_workers=max(1, generation_concurrency)) as pool:
+                for index, text in zip(fallback, pool.map(generate_title, fallback)):
+                    results[index] = text
+        return results
+    return work
+
+def extract_article_tags(payloads: List[ExtractionPayload]) -> List[Extraction]:
+    return extract_tags([article or "" for _, _, article in payloads])
+
+def extract_article_excerpt(payloads: List[ExtractionPayload]) -> List[Extraction]:
+    return [extract_excerpt(article or "", title) for title, _, article in payloads]
+
+def apply_article_fields(trend: Trend, fields: ArticleFields) -> None:
+    if fields["article"]:
+        trend.article = fields["article"]
+    if fields["tags"]:
+        trend.article_tags = fields["tags"]
+    if fields["excerpt"]:
+        trend.article_excerpt = fields["excerpt"]
+    apply_article_title(trend, fields["title"])
+
+
+def trends_pending_title() -> Query:
+    return trends_in_stage("title")
+
+def apply_article_title(trend: Trend, title: Optional[str]) -> None:
+    trend.title = title
+    if title:
+        advance(trend, "title")
+    trend.timestamp = f"{datetime.now()}:process_article_title_trends_02"
+
 
 def process_article_title_trends_02() -> None:
     """
     Generate article titles for trends that don't have a title yet.
 
     This function queries the database for trends that have a `trend_name` but no `title`,
-    generates an article title for each trend using the `generate_article_title` function,
-    and updates the `title` attribute of each trend with the generated title.
+    generates an article title for each trend concurrently using the `generate_article_title` function,
+    and updates the `title` attribute of each trend with the generated title as it completes.
+    With `generation_mode` set to "combined", the article, tags and excerpt are generated in the same
+    completion and stored as well.
 
     Returns:
         None.
     """
-    with session.begin_nested():
-        trends: List[Trend] = session.query(Trend).filter(
-            and_(Trend.trend_name.isnot(None), Trend.title.is_(None))).limit(1).all()
-
-        titles: List[str] = [generate_article_title(trend.trend_name) for trend in trends]
+    with UnitOfWork() as unit:
+        trends: List[Trend] = unit.query(trends_pending_title()).all()
+        if generation_mode == "combined":
+            fan_out(trends, generate_article_fields, unit.applier(apply_article_fields), prepare=lambda trend: trend.trend_name)
+        else:
+            fan_out(trends, generate_article_title, unit.applier(apply_article_title), prepare=lambda trend: trend.trend_name)
 
-        for trend, title in zip(trends, titles):
-            title: str = generate_article_title(trend.trend_name)
-            trend.title = title
-            trend.timestamp = f"{datetime.now()}:process_article_title_trends_02"
 
-
-def create_article(title: str, content: str, status: str = "draft") -> Optional[Dict[str, Any]]:
+def create_article(title: str, content: str, status: str = "draft", **fields: Any) -> Optional[Dict[str, Any]]:
     """
     Creates a new article in WordPress with the given title and content.
 
@@ -123,20 +424,19 @@ def create_article(title: str, content: str, status: str = "draft") -> Optional[
         title (str): The title of the article.
         content (str): The content of the article.
         status (str, optional): The status of the article. Defaults to "draft".
+        **fields (Any): Any other post fields to set in the same request, e.g. excerpt, tags, categories or featured_media.
 
     Returns:
         Optional[Dict[str, Any]]: A dictionary containing information about the created article, or None if the article was not created.
     """
-    auth_header: AuthHeader = {}
-    auth_header["Authorization"] = f"Basic {base64.b64encode((username + ':' + application_password).encode()).decode()}"
-
     post_data: PostData = {
         "title": title,
         "content": content,
-        "status": status
+        "status": status,
+        **fields,
     }
 
-    response: APIResponse = requests.post(f"{api_base_url}posts", headers=auth_header, json=post_data)
+    response: requests.Response = wordpress.post("posts", json=post_data)
 
     if response.status_code == 201:
         return response.json()
@@ -144,6 +444,18 @@ def create_article(title: str, content: str, status: str = "draft") -> Optional[
         print(f"Error creating article: {response.json()}")
         return None
 
+def create_placeholder_article(title: str) -> Optional[Dict[str, Any]]:
+    return create_article(title, "This is a test article.")
+
+def trends_pending_creation() -> Query:
+    return trends_in_stage("creation")
+
+def apply_article_creation(trend: Trend, article: Optional[Dict[str, Any]]) -> None:
+    trend.article_id: Optional[int] = article["id"] if article else None
+    if article:
+        advance(trend, "creation")
+    trend.timestamp = f"{datetime.now()}:process_article_creation_03"
+
 def process_article_creation_03() -> None:
     """
     Create articles for trends that have a title but no article.
@@ -155,15 +467,12 @@ def process_article_creation_03() -> None:
     Returns:
         None.
     """
-    with session.begin_nested():
-        trends: List[Trend] = session.query(Trend).filter(Trend.article_id.is_(None), Trend.title.isnot(None)).all()
+    with UnitOfWork() as unit:
+        trends: List[Trend] = unit.query(trends_pending_creation()).all()
+        apply: Callable[[Trend, Any], None] = unit.applier(apply_article_creation)
         for trend in trends:
             try:
-                title: str = trend.title.replace('"', '')
-                article: Optional[Dict[str, Any]] = create_article(title, "This is a test article.")
-                trend.article_id: Optional[int] = article["id"] if article else None
-                trend.timestamp = f"{datetime.now()}:process_article_creation_03"
-                session.add(trend)
+                apply(trend, create_placeholder_article(trend.title.replace('"', '')))
             except Exception as e:
                 print(e)
                 pass
@@ -178,41 +487,132 @@ def generate_article_content(keyword: str) -> Optional[str]:
     Returns:
         Optional[str]: The generated article content, or None if the generation failed.
     """
-    prompt: str = f"Generate an article with 4 paragraphs about {keyword} with a call to action."
-    response: openai.Response = openai.Completion.create(
-        engine="text-davinci-003",
-        prompt=prompt,
-        max_tokens=1000,
-        n=1,
-        stop=None,
-        temperature=0.7,
-    )
-    only_choice: str = response.choices[0].text.strip()
+    only_choice: str = complete(*content_prompt(keyword), field="content")
     return only_choice if only_choice else None
 
+def content_prompt(keyword: str) -> Prompt:
+    return f"Generate an article with 4 paragraphs about {keyword} with a call to action.", 1000
+
+def trends_pending_content() -> Query:
+    return trends_in_stage("content", with_article=generation_mode == "combined" or stream_articles)
+
+def prepare_article_content(trend: Trend) -> Tuple[str, Optional[str]]:
+    # Only combined generation can have filled in the article already; don't load it otherwise.
+    return trend.title, trend.article if generation_mode == "combined" else None
+
+# (trend id, title, article from combined generation, checkpointed draft, whether tags and excerpt are still missing)
+StreamPayload = Tuple[int, str, Optional[str], Optional[str], bool]
+
+def prepare_streamed_content(trend: Trend) -> StreamPayload:
+    draft: Optional[str] = trend.content.draft if trend.content is not None else None
+    existing: Optional[str] = trend.article if generation_mode == "combined" else None
+    return trend.id, trend.title, existing, draft, not (trend.article_tags and trend.article_excerpt)
+
+def stream_article_content(payload: StreamPayload) -> ArticleFields:
+    """
+    Generates an article as a token stream, checkpointing the text to the database as it arrives.
+
+    A checkpointed draft from an interrupted run is continued instead of starting over. Once the first
+    `stream_opening_paragraphs` paragraphs are written, the tags and excerpt are generated from them
+    concurrently while the rest of the article streams in, so their stages find them already done.
+    This function runs on a worker thread; checkpoints use a connection of their own.
+
+    Args:
+        payload (StreamPayload): From `prepare_streamed_content`.
+
+    Returns:
+        ArticleFields: The "article", and the "tags" and "excerpt" if they were generated early.
+    """
+    trend_id, title, existing, draft, early = payload
+    fields: ArticleFields = dict.fromkeys(ARTICLE_FIELDS)
+    if existing or is_local("content"):
+        # The local model answers in one piece; there is nothing to checkpoint.
+        fields["article"] = existing or generate_article_content(title)
+        return fields
+    prompt, max_tokens = content_prompt(title)
+    cache: Optional[CompletionCache] = get_cache()
+    key: str = CompletionCache.key(get_backend("content").model, prompt, max_tokens, 0.7)
+    cached: Optional[str] = cache.get(key) if cache is not None else None
+    if cached is not None:
+        fields["article"] = cached
+        return fields
+
+    text: str = draft or ""
+    if text:
+        print(f"Resuming the article of trend {trend_id} from a {len(text)} character draft.")
+    saved: int = len(text)
+    opening: Dict[str, Future] = {}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        def start_opening(final: bool) -> None:
+            paragraphs: List[str] = [paragraph for paragraph in text.strip().split("\n\n") if paragraph.strip()]
+            # The last paragraph is only complete once the next one has started or the stream has ended.
+            if opening or not early or not stream_opening_paragraphs or len(paragraphs) < stream_opening_paragraphs + (not final):
+                return
+            start: str = "\n\n".join(paragraphs[:stream_opening_paragraphs])
+            opening["tags"] = pool.submit(generate_article_tags, f"{title}: {start}")
+            opening["excerpt"] = pool.submit(generate_article_excerpt, f"{title}\n\n{start}")
+
+        try:
+            for piece in get_backend("content").stream(prompt, max(1, max_tokens - len(text) // 4), prefix=text):
+                text += piece
+                if len(text) - saved >= stream_checkpoint_chars or "\n" in piece:
+                    save_draft(trend_id, text)
+                    saved = len(text)
+                    start_opening(final=False)
+        finally:
+            if len(text) > saved:
+                save_draft(trend_id, text)
+        start_opening(final=True)
+        for name, future in opening.items():
+            try:
+                fields[name] = future.result()
+            except Exception as e:
+                print(f"Error generating the {name} of trend {trend_id} from its opening: {e}")
+
+    fields["article"] = text.strip() or None
+    if cache is not None and fields["article"]:
+        cache.put(key, fields["article"])
+    return fields
+
+def apply_streamed_content(trend: Trend, fields: ArticleFields) -> None:
+    # The worker may have created the content row for its checkpoints after the trend was loaded.
+    object_session(trend).refresh(trend, ["content"])
+    if fields["article"] and trend.content is not None:
+        trend.content.draft = None
+    if fields["tags"] and not trend.article_tags:
+        trend.article_tags = fields["tags"]
+    if fields["excerpt"] and not trend.article_excerpt:
+        trend.article_excerpt = fields["excerpt"]
+    apply_article_content(trend, fields["article"])
+
+def apply_article_content(trend: Trend, article: Optional[str]) -> None:
+    trend.article = article
+    if article:
+        advance(trend, "content")
+    trend.timestamp = f"{datetime.now()}:process_article_content_generation_04"
+
 def process_article_content_generation_04() -> None:
     """
     Generates article content for all trends that have a title but no article content.
 
     This function queries the database for trends that have a `trend_name` and `title` but no `article`,
-    generates article content for each trend using the `generate_article_content` function,
-    and updates the `article` attribute of each trend with the generated content.
+    generates article content for each trend concurrently using the `generate_article_content` function,
+    and updates the `article` attribute of each trend with the generated content as it completes.
+    With `stream_articles` enabled, articles are streamed and checkpointed by `stream_article_content`.
 
     Returns:
         None.
     """
-    with session.begin_nested():
-        all_trends: List[Trend] = session.query(Trend).filter(and_(Trend.title.isnot(None), Trend.article.is_(None))).all()
-        for trend in all_trends:
-            try:
-                article: Optional[str] = generate_article_content(trend.title)
-                trend.article = article
-                trend.timestamp = f"{datetime.now()}:process_article_content_generation_04"
-            except Exception as e:
-                print(e)
-                pass
-
-def update_article(postId: int, content: str, title: str, status: str = "draft") -> Optional[Dict[str, Any]]:
+    with UnitOfWork() as unit:
+        all_trends: List[Trend] = unit.query(trends_pending_content()).all()
+        if stream_articles:
+            fan_out(all_trends, stream_article_content, unit.applier(apply_streamed_content),
+                    prepare=prepare_streamed_content)
+            return
+        fan_out(all_trends, reuse_or_generate(generate_article_content), unit.applier(apply_article_content),
+                prepare=prepare_article_content)
+
+def update_article(postId: int, content: str, title: str, status: str = "draft", **fields: Any) -> Optional[Dict[str, Any]]:
     """
     Updates an existing article on a WordPress site.
 
@@ -221,21 +621,21 @@ def update_article(postId: int, content: str, title: str, status: str = "draft")
         content (str): The new content of the post.
         title (str): The new title of the post.
         status (str, optional): The new status of the post. Defaults to "draft".
+        **fields (Any): Any other post fields to set in the same request, e.g. excerpt, tags or featured_media.
 
     Returns:
         Optional[Dict[str, Any]]: A dictionary containing the updated post data, or None if the update failed.
     """
 
-    headers: Dict[str, str] = {"Authorization": f"Basic {auth_header}"}
-
     post_data: Dict[str, Any] = {
         "title": title,
         "content": content,
         "status": status,
-        "categories": [373]
+        "categories": [373],
+        **fields,
     }
 
-    response: requests.Response = requests.post(f"{api_base_url}posts/{postId}", headers=headers, json=post_data)
+    response: requests.Response = wordpress.post(f"posts/{postId}", json=post_data)
 
     if response.status_code in [200, 201]:
         return response.json()
@@ -244,6 +644,14 @@ def update_article(postId: int, content: str, title: str, status: str = "draft")
         print(f"Error editing article: {response.json()}")
         return None
 
+def trends_pending_update() -> Query:
+    return trends_in_stage("update", with_article=True)
+
+def apply_article_update(trend: Trend, article: Optional[Dict[str, Any]]) -> None:
+    trend.article_wordpress_updated = True
+    advance(trend, "update")
+    trend.timestamp = f"{datetime.now()}:process_article_update_05"
+
 def process_article_update_05() -> None:
     """
     Updates all articles in the database that have not been published yet.
@@ -253,14 +661,13 @@ def process_article_update_05() -> None:
     Returns:
         None
     """
-    with session.begin_nested():
-        all_trends: List[Trend] = session.query(Trend).filter(Trend.article_wordpress_updated.is_(None), Trend.article_id.isnot(None)).all()
+    with UnitOfWork() as unit:
+        all_trends: List[Trend] = unit.query(trends_pending_update()).all()
+        apply: Callable[[Trend, Any], None] = unit.applier(apply_article_update)
         for trend in all_trends:
             try:
                 trend.title = trend.title.replace('"', '')
-                update_article(postId=trend.article_id, content=trend.article, title=trend.title)
-                trend.article_wordpress_updated = True
-                trend.timestamp = f"{datetime.now()}:process_article_update_05"
+                apply(trend, update_article(postId=trend.article_id, content=trend.article, title=trend.title))
             except Exception as e:
                 print(e)
 
@@ -274,70 +681,61 @@ def generate_article_tags(keyword: str) -> Optional[str]:
     Returns:
         Optional[str]: A string of comma-separated tags without hashes, or None if no tags were generated.
     """
-    prompt: str = f"Write ten tags for an article about this topic [{keyword}]. Create comma separated tags without hashes."
-    response = openai.Completion.create(
-        engine="text-davinci-003",
-        prompt=prompt,
-        max_tokens=50,
-        n=1,
-        stop=None,
-        temperature=0.7,
-    )
-    only_choice: str = response.choices[0].text.strip()
+    only_choice: str = complete(*tags_prompt(keyword), field="tags")
     return only_choice if only_choice else None
 
+def tags_prompt(keyword: str) -> Prompt:
+    return f"Write ten tags for an article about this topic [{keyword}]. Create comma separated tags without hashes.", 50
+
+def trends_pending_tags() -> Query:
+    return trends_in_stage("tags", with_article="tags" in local_extraction)
+
+def prepare_article_tags(trend: Trend) -> ExtractionPayload:
+    return trend.title, trend.article_tags, trend.article if "tags" in local_extraction else None
+
+def apply_article_tags(trend: Trend, tags: Optional[str]) -> None:
+    trend.article_tags = tags
+    if tags:
+        advance(trend, "tags")
+    trend.timestamp = f"{datetime.now()}:process_article_tags_generation_06"
+
 def process_article_tags_generation_06() -> None:
     """
     Generates tags for all articles in the database that have not been tagged yet.
 
-    This function retrieves all trends from the database that have an associated article but have not been tagged yet. It then generates tags for each article using OpenAI's GPT-3 API and saves the tags to the database.
+    This function retrieves all trends from the database that have an associated article but have not been tagged yet. It then generates tags for the articles concurrently using OpenAI's GPT-3 API and saves the tags to the database as they complete.
+    With "tags" in `local_extraction`, the tags are extracted from the articles instead, see `extract_or_generate`.
 
     Returns:
         None
     """
-    with session.begin_nested():
-        all_trends = session.query(Trend).filter(and_(Trend.article != '', Trend.article_tags.is_(None)))
-        for trend in all_trends:
-            try:
-                tags: Optional[str] = generate_article_tags(keyword=trend.title)
-                trend.article_tags = tags
-                trend.timestamp = f"{datetime.now()}:process_article_tags_generation_06"
-            except Exception as e:
-                print(e)
-                session.rollback()
+    with UnitOfWork() as unit:
+        all_trends: List[Trend] = unit.query(trends_pending_tags()).all()
+        if "tags" in local_extraction:
+            store: Callable[[Trend, Any], None] = unit.applier(apply_article_tags)
+            work = extract_or_generate(extract_article_tags, generate_article_tags)
+            for trend, tags in zip(all_trends, work([prepare_article_tags(trend) for trend in all_trends])):
+                store(trend, tags)
+            return None
+        fan_out(all_trends, reuse_or_generate(generate_article_tags), unit.applier(apply_article_tags), prepare=prepare_article_tags)
 
     return None
 
 def get_tags() -> Dict[str, int]:
     """
-    Retrieves all current tags from the WordPress site and returns them as a dictionary with tag names as keys and tag IDs as values.
+    Retrieves all current tags from the local tag index, refreshing it from the WordPress site first, and returns them as a dictionary with tag names as keys and tag IDs as values.
 
     Returns:
         Dict[str, int]: A dictionary with tag names as keys and tag IDs as values.
     """
-    all_current_tags_with_ids: Dict[str, int] = {}
-    params: Dict[str, int] = {'per_page': 10}
-    response = requests.get(tags_url, params=params)
-    total_tags: int = int(response.headers.get('X-WP-Total'))
-    tags_per_page: int = 10
-    total_pages: int = int(response.headers.get('X-WP-TotalPages'))
-    print(f'Total number of tags: {total_tags}')
-    print(f'Tags per page: {tags_per_page}')
-    print(f'Total number of pages: {total_pages}')
-
-    for page in range(1, total_pages + 1):
-        params = {'per_page': 10, 'page': page}
-        response = requests.get(tags_url, params=params)
-        tags = response.json()
-        for tag in tags:
-            all_current_tags_with_ids[tag['name']] = tag['id']
-    return all_current_tags_with_ids
+    refresh_tag_index()
+    return {tag.name: tag.id for tag in session.query(WordPressTag)}
 
 def tags_on_wordpress_check_and_update(tags_from_article: List[str]) -> None:
     """
     Checks if tags from an article already exist on the WordPress site and creates new tags if necessary.
 
-    This function takes a list of tags from an article and checks if each tag already exists on the WordPress site. If a tag does not exist, it creates a new tag using the WordPress API.
+    This function takes a list of tags from an article and checks each tag against the local tag index. If a tag does not exist, it creates a new tag using the WordPress API and adds it to the index.
 
     Args:
         tags_from_article (List[str]): A list of tags from an article.
@@ -345,20 +743,7 @@ def tags_on_wordpress_check_and_update(tags_from_article: List[str]) -> None:
     Returns:
         None
     """
-    current_tags = get_tags()
-    for tag in tags_from_article:
-        print(tag.strip())
-        try:
-            print(f'Current Tag: {tag}')
-            current_tags[tag.strip()]
-        except:
-            print(f'New tag: {tag}')
-            post_data: Dict[str, str] = {'name': tag.strip()}
-
-            headers: Dict[str, str] = {"Authorization": f"Basic {auth_header}"}
-            response = requests.post(f"{api_base_url}tags", headers=headers, json=post_data)
-            print(f"Response: {response.status_code}")
-            print(response.json())
+    ensure_tag_ids(tags_from_article)
 
     return None
 
@@ -369,18 +754,16 @@ def add_tags_to_article(tags_array: List[int], article_id: int) -> None:
     for tag in tags_array:
         tags.append({'id': tag})
     print(tags)
-    url: str = f"https://www.blacktwitter.eu/wp-json/wp/v2/posts/{article_id}"
     t_: Dict[str, List[Dict[str, int]]] = {'tags': tags}
     t_['name'] = 'newtag'
     print(t_)
-    headers: Dict[str, str] = {"Authorization": f"Basic {auth_header}"}
-    response = requests.post(url, headers=headers, json=t_)
+    response = wordpress.post(f"posts/{article_id}", json=t_)
     print(f"Response: {response.status_code}")
     print(response.json())
 
 def ensure_all_tags_exist() -> None:
     with session.begin_nested():
-        trends = session.query(Trend).filter(and_(Trend.article_id != None, Trend.article != '', Trend.article_tags.is_(None))).all()
+        trends = session.query(Trend).filter(and_(Trend.article_id != None, Trend.article_tags.isnot(None), Trend.article_tags_added.is_(None))).all()
         for trend in trends:
             try:
                 tags = trend.article_tags.split(',')
@@ -389,70 +772,135 @@ def ensure_all_tags_exist() -> None:
                 print(e)
                 pass
 
+def trends_pending_tags_added() -> Query:
+    return trends_in_stage("tags_added")
+
+def prepare_article_tags_added(trend: Trend) -> Tuple[int, List[str]]:
+    return trend.article_id, trend.article_tags.split(',')
+
+def set_article_tags(article_id: int, tag_ids: List[int]) -> requests.Response:
+    """
+    Sets the tags of an existing article on WordPress.
+
+    Args:
+        article_id (int): The ID of the post.
+        tag_ids (List[int]): The IDs of the tags to set.
+
+    Returns:
+        requests.Response: The WordPress response.
+    """
+    response: requests.Response = wordpress.post(f"posts/{article_id}", json={'tags': tag_ids})
+    print(f"Status Code: {response.status_code}")
+    return response
+
+def tag_article(article_id: int, tag_names: List[str]) -> requests.Response:
+    """
+    Resolves tag names to tag IDs, creating the tags that are missing, and sets them on an existing article.
+
+    Args:
+        article_id (int): The ID of the post.
+        tag_names (List[str]): The tag names of the article.
+
+    Returns:
+        requests.Response: The WordPress response.
+    """
+    return set_article_tags(article_id, ensure_tag_ids(tag_names))
+
+def apply_article_tags_added(trend: Trend, response: requests.Response) -> None:
+    trend.article_tags_added = True
+    advance(trend, "tags_added")
+    trend.timestamp = f"{datetime.now()}:process_article_tags_07"
+
 def process_article_tags_07() -> None:
     """
     Processes article tags for all trends in the database that have article tags but no tags added to the article yet.
-    Retrieves all tags from the database and loops through all trends to find tags that match.
-    If a tag is found, it is added to the list of found tags. If not, it is added to the list of not found tags.
-    The list of found tags is then added to the article using the WordPress API.
+    Refreshes the local tag index once, then maps each trend's tags to tag IDs, creating the tags that are missing.
+    The tag IDs are then added to the article using the WordPress API.
     """
 
-    with session.begin_nested():
-        all_trends = session.query(Trend).filter(and_(Trend.article_tags.isnot(None), Trend.article_tags_added.is_(None))).all()
+    with UnitOfWork() as unit:
+        all_trends: List[Trend] = unit.query(trends_pending_tags_added()).all()
+        if not all_trends:
+            return None
+        refresh_tag_index()
+        session.commit()
+        apply: Callable[[Trend, Any], None] = unit.applier(apply_article_tags_added)
         for trend in all_trends:
-            tags = get_tags()
-            ensure_all_tags_exist()
-            found_tags: List[int] = []
-            not_found_tags: List[str] = []
-            for tag in trend.article_tags.split(','):
-                try:
-                    tag_ = tag.strip()
-                    found_tags.append(tags[tag_])
-                except Exception as e:
-                    not_found_tags.append(tag_)
-                    print(e)
-            postData: Dict[str, List[int]] = {}
-            postData['tags'] = found_tags
-            headers: Dict[str, str] = {"Authorization": f"Basic {auth_header}"}
             try:
-                response = requests.post(f"{api_base_url}posts/{trend.article_id}", headers=headers, json=postData)
-                trend.article_tags_added = True
-                trend.timestamp = f"{datetime.now()}:process_article_tags_07"
+                apply(trend, tag_article(*prepare_article_tags_added(trend)))
             except Exception as e:
                 print(e)
                 print(f"Error: {trend.article_id}")
                 pass
-            print(f"Status Code: {response.status_code}")
+
+def generate_article_excerpt(title: str) -> Optional[str]:
+    """
+    Generates a two sentence synopsis of an article with the given title using OpenAI's GPT-3 API.
+
+    Args:
+        title (str): The title of the article.
+
+    Returns:
+        Optional[str]: The generated synopsis, or None if no synopsis was generated.
+    """
+    only_choice: str = complete(*excerpt_prompt(title), field="excerpt")
+    return only_choice if only_choice else None
+
+def excerpt_prompt(title: str) -> Prompt:
+    return f"Write a two sentence synopsis of [{title}].", 50
+
+def trends_pending_excerpt() -> Query:
+    return trends_in_stage("excerpt", with_article="excerpt" in local_extraction)
+
+def prepare_article_excerpt(trend: Trend) -> ExtractionPayload:
+    return trend.title, trend.article_excerpt, trend.article if "excerpt" in local_extraction else None
+
+def apply_article_excerpt(trend: Trend, excerpt: Optional[str]) -> None:
+    print(f"{trend.id} - {trend.title}")
+    trend.article_excerpt = excerpt
+    if excerpt:
+        advance(trend, "excerpt")
 
 def process_article_excerpts_08() -> None:
     """
-    Generates a two sentence synopsis of each article in the database that has a title, article_id, article, article_excerpt, article_tags, and article_status.
-    Uses OpenAI's text-davinci-003 engine to generate the synopsis.
-    The generated synopsis is then added to the article_excerpt field in the database.
+    Generates a two sentence synopsis of each article in the database that has a title but no article_excerpt.
+    Uses the configured generation backend to generate the synopses concurrently.
+    Each generated synopsis is added to the article_excerpt field in the database as it completes.
+    With "excerpt" in `local_extraction`, the synopses are extracted from the articles instead, see `extract_or_generate`.
     """
+    with UnitOfWork() as unit:
+        all_trends: List[Trend] = unit.query(trends_pending_excerpt()).all()
+        if "excerpt" in local_extraction:
+            store: Callable[[Trend, Any], None] = unit.applier(apply_article_excerpt)
+            work = extract_or_generate(extract_article_excerpt, generate_article_excerpt)
+            for trend, excerpt in zip(all_trends, work([prepare_article_excerpt(trend) for trend in all_trends])):
+                store(trend, excerpt)
+            return
+        fan_out(all_trends, reuse_or_generate(generate_article_excerpt), unit.applier(apply_article_excerpt), prepare=prepare_article_excerpt)
+
+def update_excerpt(article_id: int, excerpt: str) -> requests.Response:
+    """
+    Sets the excerpt of an existing article on WordPress.
 
-    with session.begin_nested():
-        all_trends: List[Trend] = session.query(Trend).filter(and_(
-            Trend.title.isnot(None),
-            Trend.article_excerpt.is_(None),
-        ))
+    Args:
+        article_id (int): The ID of the post.
+        excerpt (str): The new excerpt.
 
-        for idx, trend in enumerate(all_trends):
-            print(f"{idx} - {trend.title}")
-            try:
-                response = openai.Completion.create(
-                    engine="text-davinci-003",
-                    prompt=f"Write a two sentence synopsis of [{trend.title}].",
-                    max_tokens=50,
-                    n=1,
-                    stop=None,
-                    temperature=0.7
-                )
-                only_choice: str = response.choices[0].text.strip()
-                trend.article_excerpt = only_choice
-            except Exception as e:
-                print(e)
-                break
+    Returns:
+        requests.Response: The WordPress response.
+    """
+    postData: dict = {"excerpt": excerpt}
+    response: requests.Response = wordpress.post(f"posts/{article_id}", data=postData)
+    print(f"Response: {response.status_code}")
+    print(excerpt)
+    return response
+
+def trends_pending_excerpt_added() -> Query:
+    return trends_in_stage("excerpt_added")
+
+def apply_article_excerpt_added(trend: Trend, response: requests.Response) -> None:
+    trend.article_excerpt_added = True
+    advance(trend, "excerpt_added")
 
 def process_article_excerpt_09() -> None:
     """
@@ -460,32 +908,38 @@ def process_article_excerpt_09() -> None:
     Uses the WordPress REST API to update the excerpt of each article.
     """
 
-    def update_excerpt(excerpt: str) -> None:
-        headers: dict = {"Authorization": f"Basic {auth_header}"}
-        postData: dict = {"excerpt": excerpt}
-        response: requests.Response = requests.post(f"{api_base_url}posts/{trend.article_id}", headers=headers, data=postData)
-        print(response)
-        print(f"Response: {response.status_code}")
-        print(response.status_code)
-        print(excerpt)
-
-    with session.begin_nested():
-        all_trends = session.query(Trend).filter(and_(
-            Trend.article_excerpt.isnot(None),Trend.article_excerpt_added.is_(None)
-        ))
+    with UnitOfWork() as unit:
+        all_trends: List[Trend] = unit.query(trends_pending_excerpt_added()).all()
 
+        apply: Callable[[Trend, Any], None] = unit.applier(apply_article_excerpt_added)
         for trend in all_trends:
             try:
-                update_excerpt(trend.article_excerpt)
-                trend.article_excerpt_added = True
+                apply(trend, update_excerpt(trend.article_id, trend.article_excerpt))
             except Exception as e:
                 print(e)
 
-generator = StableDiffusion(
-    img_height=512,
-    img_width=512,
-    jit_compile=False,
-)
+def generate_images(jobs: List[ImageJob]) -> List[List[str]]:
+    """
+    Generates images for a batch of prompts using the StableDiffusion model.
+
+    When `image_worker_address` is configured the batch is sent to the warm image worker,
+    otherwise (or if the worker is not running) the model is loaded in this process on first use.
+
+    Args:
+        jobs (List[ImageJob]): Dictionaries with "prompt" and "filename" keys.
+
+    Returns:
+        List[List[str]]: The filenames written for each job, primary image first.
+    """
+    if image_worker_address:
+        remote_jobs: List[ImageJob] = [{"prompt": job["prompt"], "filename": os.path.abspath(job["filename"])} for job in jobs]
+        reply = request_images(remote_jobs)
+        if reply is not None:
+            if not reply["ok"]:
+                raise RuntimeError(reply["error"])
+            return reply["files"]
+        print(f"Image worker at {image_worker_address} is not reachable, generating locally.")
+    return generate_images_local(jobs)
 
 def generate_image(prompt: str, filename:str) -> None:
     """
@@ -499,108 +953,473 @@ def generate_image(prompt: str, filename:str) -> None:
     Returns:
         None
     """
-    img = generator.generate(
-        prompt,
-        num_steps=5,
-        unconditional_guidance_scale=2,
-        temperature=1,
-        batch_size=2,
-    )
-    Image.fromarray(img[0]).save(f"{filename}")
+    generate_images([{"prompt": prompt, "filename": filename}])
+
+def image_filename(trend: Trend) -> str:
+    """
+    Returns where the featured image of a trend is stored.
+
+    Trends published through WordPress draft creation use their article_id; trends that are
+    published in a single request have no article_id yet and use their own id.
+
+    Args:
+        trend (Trend): The trend.
+
+    Returns:
+        str: The image path, e.g. "images/123.png" or "images/trend-45.png".
+    """
+    if trend.article_id is not None:
+        return f"images/{trend.article_id}.png"
+    return f"images/trend-{trend.id}.png"
+
+def trends_pending_image() -> Query:
+    return trends_in_stage("image")
+
+def prepare_article_image(trend: Trend) -> ImageJob:
+    return {"prompt": trend.title, "filename": image_filename(trend)}
+
+def generate_missing_images(jobs: List[ImageJob]) -> List[List[str]]:
+    """
+    Generates images for the jobs whose file does not exist yet.
+
+    Args:
+        jobs (List[ImageJob]): Dictionaries with "prompt" and "filename" keys.
+
+    Returns:
+        List[List[str]]: The filenames for each job, primary image first; existing files are returned as-is.
+    """
+    os.makedirs("images", exist_ok=True)
+    missing: List[ImageJob] = [job for job in jobs if not os.path.exists(job["filename"])]
+    generated: Dict[str, List[str]] = dict(zip((job["filename"] for job in missing), generate_images(missing) if missing else []))
+    return [generated.get(job["filename"], [job["filename"]]) for job in jobs]
+
+def apply_article_image(trend: Trend, filenames: List[str]) -> None:
+    trend.article_image_location: Optional[str] = filenames[0]
+    advance(trend, "image")
+    if len(filenames) > 1:
+        print(f"Candidate images for {trend.title}: {filenames}")
 
 def process_trends_10() -> None:
     """
-    Processes all trends that have an article_id, article, article_tags, no article_image_location, and article_status is not published.
+    Processes all trends that have an article, article_tags, no article_image_location, and article_status is not published.
     Generates an image based on the trend's title using the StableDiffusion model and saves it to the specified filename.
     Updates the trend's article_image_location with the filename.
-    """
-    with session.begin_nested():
-        all_trends: List[Trend] = session.query(Trend).filter(and_(
-            Trend.article_id != None,
-            Trend.article != '',
-            Trend.article_tags != None,
-            Trend.article_image_location.is_(None),
-            Trend.article_status.isnot('published')
-        )).all()
 
+    Pending trends are generated in batches of `default_image_batch_size()` prompts.
+    """
+    with UnitOfWork() as unit:
+        all_trends: List[Trend] = unit.query(trends_pending_image()).all()
 
-        for trend in all_trends:
+        batch_size: int = default_image_batch_size()
+        for start in range(0, len(all_trends), batch_size):
+            batch: List[Trend] = all_trends[start:start + batch_size]
             try:
-                filename: str = f"images/{trend.article_id}.png"
-                if not os.path.exists(filename):
-                    generate_image(trend.title, filename)
-                trend.article_image_location: Optional[str] = filename
-                session.add(trend)
+                files: List[List[str]] = generate_missing_images([prepare_article_image(trend) for trend in batch])
+                for trend, filenames in zip(batch, files):
+                    unit.apply(trend, apply_article_image, filenames)
+                unit.flush()
             except Exception as e:
                 print(e)
 
+def trends_pending_optimization() -> Query:
+    return trends_in_stage("optimize")
+
+def apply_optimized_image(trend: Trend, report: ImageReport) -> None:
+    trend.article_image_location = report["path"]
+    advance(trend, "optimize")
+    print(format_report(report))
+
+def process_optimize_images_10b() -> None:
+    """
+    Compresses the generated images of all trends that are about to be published.
+
+    Each PNG from stage 10 is converted to `image_format` at `image_quality`, resized variants are written for
+    `image_sizes`, and the trend's article_image_location is pointed at the compressed image. The byte count
+    before and after is printed for every image.
+
+    Returns:
+        None
+    """
+    with UnitOfWork() as unit:
+        all_trends: List[Trend] = unit.query(trends_pending_optimization()).all()
+        fan_out(all_trends, optimize_image, unit.applier(apply_optimized_image),
+                prepare=lambda trend: trend.article_image_location)
+
+def upload_featured_image(img_filename: str) -> int:
+    """
+    Uploads an image to the WordPress media library, streaming it from disk.
+
+    Args:
+        img_filename (str): The path of the image to upload.
+
+    Returns:
+        int: The ID of the uploaded media item.
+    """
+    return stream_upload(img_filename)
+
+def trends_pending_featured_image() -> Query:
+    return trends_in_stage("featured_image")
+
+def prepare_featured_image(trend: Trend) -> Tuple[int, str, Optional[int]]:
+    return trend.article_id, trend.article_image_location, lookup_media(trend.article_image_location)
+
+def publish_with_featured_image(article_id: int, img_filename: str, image_id: Optional[int] = None) -> Tuple[int, str]:
+    """
+    Uploads the featured image of an existing article and publishes the article.
+
+    Args:
+        article_id (int): The ID of the post.
+        img_filename (str): The path of the image to upload.
+        image_id (Optional[int], optional): The media ID of an earlier upload of the same image, which is then reused. Defaults to None.
+
+    Returns:
+        Tuple[int, str]: The media ID and the link to the published article.
+    """
+    if image_id is None:
+        image_id = upload_featured_image(img_filename)
+        # Recorded before the post is updated, so a retry after a failed update reuses the upload.
+        record_media(img_filename, image_id)
+    post_data = {
+        "featured_media": image_id,
+        "status": "publish"
+    }
+    post_response = wordpress.put(f"posts/{article_id}", json=post_data)
+    print(post_response.status_code)
+    return image_id, post_response.json().get("link","")
+
+def apply_featured_image(trend: Trend, published: Tuple[int, str]) -> None:
+    trend.article_image_id, trend.article_link = published
+    print(f"Link: {trend.article_link}")
+    print(trend.title)
+    trend.article_status = "published"
+    advance(trend, "featured_image")
+
 def process_update_trends_11() -> NoReturn:
     """
     Updates all trends that have an article_id, article, article_tags, article_image_location, and article_status is not published.
     Uploads the trend's article_image_location to the WordPress media library and updates the trend's article_image_id with the uploaded image's ID.
+    Images are streamed from disk several at a time, and images whose content was uploaded before reuse their media ID.
     Updates the trend's article_status to "published" and updates the trend's article_link with the link to the published article.
 
     Returns:
         None
     """
-    with session.begin_nested():
+    with UnitOfWork() as unit:
 
-        all_trends = session.query(Trend).filter(and_(Trend.article_id != None,\
-            Trend.article != '', Trend.article_tags != None, \
-            Trend.article_image_location !=None,
-            Trend.article_status.isnot('published'),
-            Trend.article_status == None)).all()
+        all_trends: List[Trend] = unit.query(trends_pending_featured_image()).all()
 
+        media_ids: Dict[str, int] = upload_media_files([trend.article_image_location for trend in all_trends])
+        apply: Callable[[Trend, Any], None] = unit.applier(apply_featured_image)
         for trend in all_trends:
             try:
-                img_filename: str = trend.article_image_location
-                media_url: str = f"{api_base_url}media"
-                auth_header: str = f"{username}:{application_password}"
-                auth_header = base64.b64encode(auth_header.encode("utf-8")).decode("utf-8")
-                img_file: bytes = open(f"{img_filename}", "rb").read()
-                media_headers = {
-                    "Authorization": f"Basic {auth_header}",'Content-Type': 'image/png','Content-Disposition' : f"attachment; filename={img_filename}"
-                }
-                media_response = requests.post(media_url, headers=media_headers, data=img_file)
-                image_id: int = media_response.json()["id"]
-                trend.article_image_id = image_id
-                post_url: str = f"{api_base_url}posts/{trend.article_id}"
-                post_data = {
-                    "featured_media": image_id,
-                    "status": "publish"
-                }
-                auth_header = f"{username}:{application_password}"
-                auth_header = base64.b64encode(auth_header.encode("utf-8")).decode("utf-8")
-                post_headers = {
-                    "Authorization": f"Basic {auth_header}",
-                    "Content-Type": "application/json"
-                }
-                post_response = requests.put(post_url, json=post_data, headers=post_headers)
-                post_link: str = post_response.json().get("link","")
-                trend.article_link = post_link
-                print(post_response.status_code)
-                print(f"Link: {post_response.json().get('link','')}")
-                print(trend.title)
-                trend.article_status = "published"
-                print(media_response.status_code)
-                session.add(trend)
-
+                apply(trend, publish_with_featured_image(
+                    trend.article_id, trend.article_image_location, media_ids.get(trend.article_image_location)
+                ))
             except Exception as e:
                 print(str(e))
                 print("error")
                 pass
 
 
+def trends_pending_publish() -> Query:
+    return trends_in_stage("publish", with_article=True)
+
+def prepare_publish_article(trend: Trend) -> PostData:
+    """
+    Builds the complete post payload of a trend.
+
+    Args:
+        trend (Trend): The trend to publish.
+
+    Returns:
+        PostData: The post fields, with the tag names under "tags", the image path under "image", the media ID
+            of an earlier upload of the same image (or None) under "image_id" instead of "featured_media", and
+            the ID of the trend's existing post (or None) under "article_id".
+    """
+    return {
+        "article_id": trend.article_id,
+        "title": trend.title.replace('"', ''),
+        "content": trend.article,
+        "excerpt": trend.article_excerpt,
+        "tags": trend.article_tags.split(','),
+        "categories": [373],
+        "image": trend.article_image_location,
+        "image_id": lookup_media(trend.article_image_location),
+        "status": "publish",
+    }
+
+def publish_article(post_data: PostData) -> Optional[Tuple[Dict[str, Any], int]]:
+    """
+    Resolves the tag IDs, creating missing tags, uploads the featured image, unless it was uploaded before, and
+    creates the finished post in a single request. A trend that already has a post, e.g. a draft of the staged
+    flow, gets that post updated with the full payload instead of a second post.
+
+    Args:
+        post_data (PostData): The payload from `prepare_publish_article`.
+
+    Returns:
+        Optional[Tuple[Dict[str, Any], int]]: The created article and the media ID, or None if the post was not created.
+    """
+    fields: PostData = dict(post_data)
+    fields["tags"] = ensure_tag_ids(fields["tags"])
+    image: str = fields.pop("image")
+    image_id: Optional[int] = fields.pop("image_id", None)
+    article_id: Optional[int] = fields.pop("article_id", None)
+    if image_id is None:
+        image_id = upload_featured_image(image)
+        # Recorded before the post is created, so a retry after a failed post reuses the upload.
+        record_media(image, image_id)
+    if article_id is not None:
+        article: Optional[Dict[str, Any]] = update_article(article_id, featured_media=image_id, **fields)
+    else:
+        article = create_article(featured_media=image_id, **fields)
+    return (article, image_id) if article is not None else None
+
+def apply_published_article(trend: Trend, published: Optional[Tuple[Dict[str, Any], int]]) -> None:
+    if published is None:
+        return None
+    article, image_id = published
+    trend.article_id = article["id"]
+    trend.article_image_id = image_id
+    trend.article_link = article.get("link", "")
+    trend.article_wordpress_updated = True
+    trend.article_tags_added = True
+    trend.article_excerpt_added = True
+    trend.article_status = "published"
+    advance(trend, "publish")
+    trend.timestamp = f"{datetime.now()}:process_publish_articles_12"
+    print(f"Link: {trend.article_link}")
+
+def process_publish_articles_12() -> None:
+    """
+    Publishes every fully generated trend to WordPress with a single post request.
+
+    This function queries the database for trends that have a title, article, tags, excerpt and image but no article_id.
+    The featured images are uploaded first, several at a time, reusing the media ID of any image uploaded before.
+    For each trend it then resolves the tag IDs and creates the post with its title, content,
+    excerpt, tags, category and featured media at once, instead of creating a placeholder draft and patching it
+    in stages 03, 05, 07, 09 and 11. Trends that fail are left untouched and retried on the next run.
+
+    Returns:
+        None
+    """
+    with UnitOfWork() as unit:
+        all_trends: List[Trend] = unit.query(trends_pending_publish()).all()
+        if not all_trends:
+            return None
+
+        refresh_tag_index()
+        session.commit()
+        upload_media_files([trend.article_image_location for trend in all_trends])
+        apply: Callable[[Trend, Any], None] = unit.applier(apply_published_article)
+        for trend in all_trends:
+            try:
+                apply(trend, publish_article(prepare_publish_article(trend)))
+            except Exception as e:
+                print(e)
+
+def pipeline_stages() -> List[Stage]:
+    """
+    Builds the stages run by the async pipeline for the configured `publish_mode`.
+
+    Only the creation of drafts depends on the mode; the staged stages and the single-request publish stage
+    always run, so trends started in the other mode are finished the way they were started.
+
+    Per-stage concurrency can be set in `stage_concurrency`; text stages default to
+    `generation_concurrency`, WordPress stages to 4 and image generation to a single batch at a time.
+    The near-duplicate check always runs one batch at a time so trends are compared in the order they arrived.
+
+    Returns:
+        List[Stage]: The pipeline stages.
+    """
+    def concurrency(name: str, default: int) -> int:
+        return int(stage_concurrency.get(name, default))
+
+    dedup_index: NearDuplicateIndex = load_dedup_index()
+    stages: List[Stage] = [
+        Stage("dedup", trends_pending_dedup, lambda trend: (trend.id, trend.trend_name), dedup_index.check, apply_dedup,
+              1, batch_size=100, batched=True),
+        Stage("title", trends_pending_title, lambda trend: trend.trend_name, generate_article_title, apply_article_title,
+              concurrency("title", generation_concurrency))
+        if generation_mode != "combined" else
+        Stage("title", trends_pending_title, lambda trend: trend.trend_name, generate_article_fields, apply_article_fields,
+              concurrency("title", generation_concurrency)),
+        Stage("content", trends_pending_content, prepare_article_content, reuse_or_generate(generate_article_content),
+              apply_article_content, concurrency("content", generation_concurrency))
+        if not stream_articles else
+        Stage("content", trends_pending_content, prepare_streamed_content, stream_article_content, apply_streamed_content,
+              concurrency("content", generation_concurrency)),
+        Stage("tags", trends_pending_tags, prepare_article_tags, reuse_or_generate(generate_article_tags),
+              apply_article_tags, concurrency("tags", generation_concurrency))
+        if "tags" not in local_extraction else
+        Stage("tags", trends_pending_tags, prepare_article_tags, extract_or_generate(extract_article_tags, generate_article_tags),
+              apply_article_tags, concurrency("tags", 1), batch_size=extraction_batch_size, batched=True),
+        Stage("excerpt", trends_pending_excerpt, prepare_article_excerpt, reuse_or_generate(generate_article_excerpt),
+              apply_article_excerpt, concurrency("excerpt", generation_concurrency))
+        if "excerpt" not in local_extraction else
+        Stage("excerpt", trends_pending_excerpt, prepare_article_excerpt, extract_or_generate(extract_article_excerpt, generate_article_excerpt),
+              apply_article_excerpt, concurrency("excerpt", 1), batch_size=extraction_batch_size, batched=True),
+        Stage("image", trends_pending_image, prepare_article_image, generate_missing_images, apply_article_image,
+              concurrency("image", 1), batch_size=default_image_batch_size(), batched=True),
+        Stage("optimize", trends_pending_optimization, lambda trend: trend.article_image_location, optimize_image,
+              apply_optimized_image, concurrency("optimize", 2)),
+    ]
+    if publish_mode == "staged":
+        stages.append(Stage("creation", trends_pending_creation, lambda trend: trend.title.replace('"', ''), create_placeholder_article,
+                            apply_article_creation, concurrency("creation", 4)))
+    # Both modes finish the trends of the other one: drafts through the staged stages, the rest with a single post.
+    stages += [
+        Stage("update", trends_pending_update,
+              lambda trend: (trend.article_id, trend.article, trend.title.replace('"', '')),
+              lambda payload: update_article(*payload), apply_article_update, concurrency("update", 4)),
+        Stage("tags_added", trends_pending_tags_added, prepare_article_tags_added,
+              lambda payload: tag_article(*payload), apply_article_tags_added, concurrency("tags_added", 4)),
+        Stage("excerpt_added", trends_pending_excerpt_added, lambda trend: (trend.article_id, trend.article_excerpt),
+              lambda payload: update_excerpt(*payload), apply_article_excerpt_added, concurrency("excerpt_added", 4)),
+        Stage("featured_image", trends_pending_featured_image, prepare_featured_image,
+              lambda payload: publish_with_featured_image(*payload), apply_featured_image, concurrency("featured_image", 4)),
+        Stage("publish", trends_pending_publish, prepare_publish_article, publish_article, apply_published_article,
+              concurrency("publish", 4)),
+    ]
+    return stages
+
+# (pending, prepare, prompt, parse, apply) of a generation stage that can run as a batch job.
+BatchStage = Tuple[Callable[[], Query], Callable[[Trend], Any], Callable[[Any], Prompt], Callable[[Optional[str]], Any], Callable[[Trend, Any], None]]
+BATCH_STAGES: Tuple[str, ...] = ("title", "content", "tags", "excerpt")
+
+def batch_stages() -> Dict[str, BatchStage]:
+    """
+    Describes how the generation stages turn trends into prompts for a batch job and the completions back into results.
+
+    Payloads of the form (keyword, existing value) whose value was already filled in by combined generation
+    are applied without a request.
+
+    Returns:
+        Dict[str, BatchStage]: The stages by name, see `BATCH_STAGES`.
+    """
+    text: Callable[[Optional[str]], Optional[str]] = lambda completion: completion or None
+    title: BatchStage = (trends_pending_title, lambda trend: trend.trend_name, title_prompt, text, apply_article_title)
+    if generation_mode == "combined":
+        title = (trends_pending_title, lambda trend: trend.trend_name, article_fields_prompt,
+                 lambda completion: parse_article_fields(completion or ""), apply_article_fields)
+    return {
+        "title": title,
+        "content": (trends_pending_content, prepare_article_content, lambda payload: content_prompt(payload[0]), text, apply_article_content),
+        "tags": (trends_pending_tags, prepare_article_tags, lambda payload: tags_prompt(payload[0]), text, apply_article_tags),
+        "excerpt": (trends_pending_excerpt, prepare_article_excerpt, lambda payload: excerpt_prompt(payload[0]), text, apply_article_excerpt),
+    }
+
+def process_batch_generation(name: str) -> None:
+    """
+    Runs a generation stage for all of its pending trends as one offline batch job.
+
+    Results that are already in the completion cache are applied right away; the other prompts are
+    submitted together, and the job is polled until it finishes, which can take hours. The database is
+    not held open while waiting. Completions are stored in the completion cache and applied to the
+    trends that are still pending; failed requests leave their trend pending for the next run.
+    Fields generated by the local model are completed on its worker processes instead of as a job, and
+    fields in `local_extraction` are only submitted for the trends whose extraction is not confident enough.
+
+    Args:
+        name (str): One of `BATCH_STAGES`.
+
+    Returns:
+        None
+    """
+    pending, prepare, prompt, parse, apply = batch_stages()[name]
+    cache: Optional[CompletionCache] = get_cache()
+    # Combined generation writes the title with the rest of the article, which always goes to the API.
+    backend = get_backend("" if name == "title" and generation_mode == "combined" else name)
+    model: str = backend.model
+    batch: List[BatchRequest] = []
+    keys: Dict[str, str] = {}
+    extractors: Dict[str, Callable[[List[ExtractionPayload]], List[Extraction]]] = {
+        "tags": extract_article_tags, "excerpt": extract_article_excerpt,
+    }
+    with UnitOfWork() as unit:
+        store: Callable[[Trend, Any], None] = unit.applier(apply)
+        todo: List[Tuple[Trend, Any]] = []
+        for trend in unit.query(pending()).all():
+            payload: Any = prepare(trend)
+            if isinstance(payload, tuple) and payload[1]:
+                store(trend, payload[1])
+            else:
+                todo.append((trend, payload))
+        if name in local_extraction:
+            # Only what cannot be extracted confidently goes into the job.
+            extracted: List[Extraction] = extractors[name]([payload for _, payload in todo])
+            confident: List[bool] = [bool(value) and confidence >= extraction_min_confidence for value, confidence in extracted]
+            for (trend, _), (value, _), ok in zip(todo, extracted, confident):
+                if ok:
+                    store(trend, value)
+            todo = [item for item, ok in zip(todo, confident) if not ok]
+        for trend, payload in todo:
+            text, max_tokens = prompt(payload)
+            key: str = CompletionCache.key(model, text, max_tokens, 0.7)
+            cached: Optional[str] = cache.get(key) if cache is not None else None
+            if cached is not None:
+                store(trend, parse(cached))
+                continue
+            custom_id: str = f"{name}-{trend.id}"
+            keys[custom_id] = key
+            batch.append((custom_id, text, max_tokens, 0.7))
+
+    if isinstance(backend, LocalBackend):
+        # Every prompt of a stage asks for the same number of tokens.
+        completions: List[str] = backend.complete_many([text for _, text, _, _ in batch], batch[0][2]) if batch else []
+        results: Dict[str, Optional[str]] = {custom_id: completion or None for (custom_id, _, _, _), completion in zip(batch, completions)}
+    else:
+        results = run_batch(name, batch)
+    with UnitOfWork() as unit:
+        store = unit.applier(apply)
+        for trend in unit.query(pending()).all():
+            custom_id = f"{name}-{trend.id}"
+            if custom_id not in results:
+                continue
+            completion: Optional[str] = results[custom_id]
+            if cache is not None and completion and custom_id in keys:
+                cache.put(keys[custom_id], completion)
+            store(trend, parse(completion))
+    print(f"Applied {sum(1 for completion in results.values() if completion)} of {len(results)} {name} batch result(s).")
+
+def run_as_daemon(num_trends: int, interval: float) -> None:
+    """
+    Keeps the pipeline running, ingesting new Reddit trends and refreshing the tag index every `interval` seconds.
+
+    Args:
+        num_trends (int): The maximum number of new trends to ingest per subreddit and cycle.
+        interval (float): Seconds between Reddit polls.
+
+    Returns:
+        None
+    """
+    reddit = get_reddit()
+
+    async def cycle() -> None:
+        await ingest_subreddits_async(reddit, num_trends)
+        refresh_tag_index()
+        session.commit()
+
+    run_daemon(pipeline_stages(), cycle, interval)
+
 
 if __name__ == '__main__':
-    process_reddit_trends_01()
-    process_article_title_trends_02()
-    process_article_creation_03()
-    process_article_content_generation_04()
-    process_article_update_05()
-    process_article_tags_generation_06()
-    process_article_tags_07()
-    process_article_excerpts_08()
-    process_article_excerpt_09()
-    process_trends_10()
-    process_update_trends_11()
+    parser = argparse.ArgumentParser(description="Turn Reddit trends into WordPress articles.")
+    parser.add_argument("--daemon", action="store_true", help="keep running and poll Reddit every --interval seconds")
+    parser.add_argument("--interval", type=float, default=daemon_interval, help="seconds between Reddit polls in daemon mode")
+    parser.add_argument("--num-trends", type=int, default=1, help="maximum new trends to ingest per subreddit and poll")
+    parser.add_argument("--batch", nargs="*", choices=BATCH_STAGES, metavar="STAGE",
+                        help="generate the pending titles, content, tags and/or excerpts as offline batch jobs and exit")
+    args = parser.parse_args()
+
+    start_metrics()
+    if args.batch is not None:
+        for name in args.batch or BATCH_STAGES:
+            process_batch_generation(name)
+    elif args.daemon:
+        run_as_daemon(args.num_trends, args.interval)
+    else:
+        process_reddit_trends_01(args.num_trends)
+        refresh_tag_index()
+        session.commit()
+        run_pipeline(pipeline_stages())
@@ -0,0 +1,141 @@
+import hashlib
+import mimetypes
+import os
+import threading
+import requests
+from datetime import datetime
+from typing import Dict, List, Optional
+from config import media_upload_concurrency
+from generation import fan_out
+from models import MediaUpload, Session, session
+from wordpress import wordpress
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Older Pythons don't know the types of the compressed images written by image_processing.
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+# Held while an upload is recorded, so two threads recording the same content don't both insert it.
+_record_lock = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    """
+    Hashes a file without reading it into memory at once.
+
+    Args:
+        path (str): The file path.
+
+    Returns:
+        str: The SHA-256 hex digest of the file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stream_upload(path: str) -> int:
+    """
+    Uploads a file to the WordPress media library, streaming it from disk over the pooled client.
+
+    This function does not touch the database and can run on a worker thread.
+
+    Args:
+        path (str): The path of the image to upload.
+
+    Returns:
+        int: The ID of the new media item.
+
+    Raises:
+        RuntimeError: If WordPress did not create the media item.
+    """
+    content_type: str = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    headers: Dict[str, str] = {
+        "Content-Type": content_type,
+        "Content-Disposition": f"attachment; filename={os.path.basename(path)}",
+    }
+    with open(path, "rb") as file:
+        response: requests.Response = wordpress.post("media", headers=headers, data=file)
+    print(f"Uploaded {path}: {response.status_code}")
+    if response.status_code != 201:
+        raise RuntimeError(f"Error uploading {path}: {response.status_code} {response.text[:200]}")
+    return response.json()["id"]
+
+
+def lookup_media(path: str) -> Optional[int]:
+    """
+    Finds the media ID of a file whose content was uploaded before.
+
+    Args:
+        path (str): The file path.
+
+    Returns:
+        Optional[int]: The media ID, or None if no file with the same content was uploaded yet.
+    """
+    upload: Optional[MediaUpload] = session.get(MediaUpload, file_sha256(path))
+    return upload.media_id if upload is not None else None
+
+
+def record_media(path: str, media_id: int, sha256: Optional[str] = None) -> None:
+    """
+    Remembers the media ID of an uploaded file by the hash of its content.
+
+    The upload is written through a session of its own, so this can be called from a worker thread right
+    after the upload succeeds.
+
+    Args:
+        path (str): The uploaded file.
+        media_id (int): Its WordPress media ID.
+        sha256 (Optional[str], optional): The file's hash, if already known. Defaults to None.
+
+    Returns:
+        None
+    """
+    sha256 = sha256 or file_sha256(path)
+    db = Session()
+    try:
+        with _record_lock:
+            db.merge(MediaUpload(sha256=sha256, media_id=media_id, filename=path, timestamp=f"{datetime.now()}"))
+            # Stages write trends through their own sessions; don't hold the database's write lock here.
+            db.commit()
+    finally:
+        db.close()
+
+
+def upload_media_files(paths: List[str], max_workers: int = media_upload_concurrency) -> Dict[str, int]:
+    """
+    Uploads several files concurrently, skipping files whose content was already uploaded.
+
+    Files with the same content are uploaded once. Files that cannot be read or uploaded are printed and left
+    out of the result, so the trends that use them fail on their own without stopping the others.
+
+    Args:
+        paths (List[str]): The files to upload.
+        max_workers (int, optional): The maximum number of uploads in flight. Defaults to `media_upload_concurrency` from the config.
+
+    Returns:
+        Dict[str, int]: The media ID of every file that is now in the media library, by path.
+    """
+    media_ids: Dict[str, int] = {}
+    by_hash: Dict[str, List[str]] = {}
+    for path in dict.fromkeys(paths):
+        try:
+            sha256: str = file_sha256(path)
+        except Exception as e:
+            print(f"Error hashing {path}: {e}")
+            continue
+        upload: Optional[MediaUpload] = session.get(MediaUpload, sha256)
+        if upload is not None:
+            media_ids[path] = upload.media_id
+        else:
+            by_hash.setdefault(sha256, []).append(path)
+
+    def apply(sha256: str, media_id: int) -> None:
+        record_media(by_hash[sha256][0], media_id, sha256)
+        for path in by_hash[sha256]:
+            media_ids[path] = media_id
+
+    fan_out(list(by_hash), lambda sha256: stream_upload(by_hash[sha256][0]), apply, max_workers)
+    return media_ids
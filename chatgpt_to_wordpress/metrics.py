@@ -0,0 +1,194 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import metrics_file, metrics_interval, metrics_port
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs: List[Tuple[str, str]] = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped: List[str] = [
+        f'{key}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for key, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """
+    A monotonically increasing, thread-safe count per label set.
+
+    Args:
+        name (str): The metric name, e.g. "pipeline_trends_total".
+        help (str): The description shown by Prometheus.
+    """
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.values: Dict[Labels, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key: Labels = _labels(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines: List[str] = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            lines += [f"{self.name}{_format(key)} {value}" for key, value in sorted(self.values.items())]
+        return lines
+
+
+class Histogram:
+    """
+    A thread-safe distribution of observed values, e.g. latencies in seconds, per label set.
+
+    Args:
+        name (str): The metric name, e.g. "pipeline_stage_seconds".
+        help (str): The description shown by Prometheus.
+        buckets (Tuple[float, ...], optional): The upper bounds of the buckets. Defaults to `DEFAULT_BUCKETS`.
+    """
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        # Per label set: the count of each bucket (not cumulative), the sum and the total count.
+        self.values: Dict[Labels, Tuple[List[int], float, int]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key: Labels = _labels(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Observes how long the body of a `with` block takes, including when it raises.
+
+        Args:
+            **labels (str): The labels of the observation, e.g. `stage="title"`.
+        """
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines: List[str] = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative: int = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    lines.append(f"{self.name}_bucket{_format(key, ('le', repr(float(bound))))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format(key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format(key)} {total}")
+                lines.append(f"{self.name}_count{_format(key)} {count}")
+        return lines
+
+
+stage_seconds = Histogram("pipeline_stage_seconds", "Time a stage spends on the external work for one trend or batch.")
+trends_processed = Counter("pipeline_trends_total", "Trends a stage has finished, by result (ok or failed).")
+flush_seconds = Histogram("database_flush_seconds", "Time to write and commit one batch of buffered trend updates.")
+external_call_seconds = Histogram("external_call_seconds", "Latency of each request to an external service.")
+external_calls = Counter("external_calls_total", "Calls to external services by HTTP status (or error).")
+openai_tokens = Counter("openai_tokens_total", "Model tokens consumed, as reported by the API (prompt or completion).")
+diffusion_seconds = Histogram("image_diffusion_seconds", "StableDiffusion time per generated image.")
+METRICS: List[object] = [
+    stage_seconds, trends_processed, flush_seconds, external_call_seconds, external_calls, openai_tokens, diffusion_seconds,
+]
+
+
+def render() -> str:
+    """
+    Formats all metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: The metrics, one sample per line.
+    """
+    lines: List[str] = []
+    for metric in METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path: str = metrics_file) -> None:
+    """
+    Writes all metrics to a file, e.g. for the node_exporter textfile collector.
+
+    The file is replaced atomically, so a collector never reads half of it.
+
+    Args:
+        path (str, optional): The file to write. Defaults to `metrics_file` from the config.
+
+    Returns:
+        None
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary: str = f"{path}.tmp"
+    with open(temporary, 'w') as file:
+        file.write(render())
+    os.replace(temporary, path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body: bytes = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Scrapes every few seconds would drown the pipeline's own output.
+        pass
+
+
+def start_metrics(port: int = metrics_port, path: str = metrics_file, interval: float = metrics_interval) -> None:
+    """
+    Exposes the metrics on an HTTP endpoint and/or in a file that is rewritten every `interval` seconds and on exit.
+
+    Both run on daemon threads. Nothing is started for a port of 0 and an empty path.
+
+    Args:
+        port (int, optional): The port serving the metrics on every path, e.g. /metrics. Defaults to `metrics_port` from the config.
+        path (str, optional): The metrics file. Defaults to `metrics_file` from the config.
+        interval (float, optional): Seconds between file writes. Defaults to `metrics_interval` from the config.
+
+    Returns:
+        None
+    """
+    if port:
+        server: ThreadingHTTPServer = ThreadingHTTPServer(("", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Serving metrics on port {port}.")
+    if path:
+        def write_periodically() -> None:
+            while True:
+                time.sleep(interval)
+                write_metrics_file(path)
+
+        threading.Thread(target=write_periodically, name="metrics-file", daemon=True).start()
+        atexit.register(write_metrics_file, path)
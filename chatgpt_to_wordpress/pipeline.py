@@ -0,0 +1,301 @@
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from sqlalchemy.orm import Query
+from config import commit_batch_size, daemon_interval, pipeline_poll_interval
+from metrics import stage_seconds, trends_processed
+from models import Trend, session
+from unit_of_work import TrendUpdate, UnitOfWork
+
+
+class Stage:
+    """
+    One step of the pipeline, applied to each trend independently.
+
+    A stage finds its eligible trends with `pending`, turns each trend into a plain payload with
+    `prepare`, runs the slow external call `work` on a worker thread, and writes the result back with
+    `apply`. `pending`, `prepare` and `apply` run on the event loop thread with the stage's own
+    database session; `work` must not touch the session or ORM objects. `apply` is expected to move
+    the trend's `pipeline_state` on; a trend it leaves in place counts as failed.
+
+    Args:
+        name (str): The stage name, used in log messages.
+        pending (Callable[[], Query]): Returns the query of trends that this stage still has to process.
+        prepare (Callable[[Trend], Any]): Extracts the payload `work` needs from a trend.
+        work (Callable[[Any], Any]): The external call, e.g. an OpenAI request or a WordPress upload.
+        apply (Callable[[Trend, Any], None]): Stores the result of `work` on the trend.
+        concurrency (int, optional): The maximum number of `work` calls in flight for this stage. Defaults to 1.
+        batch_size (int, optional): The maximum number of trends per `work` call of a batched stage. Defaults to 1.
+        batched (bool, optional): Whether `work` takes a list of payloads and returns a list of results in the same
+            order, even when a batch holds a single trend. Unbatched stages always handle one trend per call. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pending: Callable[[], Query],
+        prepare: Callable[[Trend], Any],
+        work: Callable[[Any], Any],
+        apply: Callable[[Trend, Any], None],
+        concurrency: int = 1,
+        batch_size: int = 1,
+        batched: bool = False,
+    ) -> None:
+        self.name: str = name
+        self.pending: Callable[[], Query] = pending
+        self.prepare: Callable[[Trend], Any] = prepare
+        self.work: Callable[[Any], Any] = work
+        self.apply: Callable[[Trend, Any], None] = apply
+        self.concurrency: int = max(1, concurrency)
+        self.batched: bool = batched
+        self.batch_size: int = max(1, batch_size) if batched else 1
+        self.running: int = 0
+        self.in_flight: Set[int] = set()
+        self.failed: Set[int] = set()
+
+    def __repr__(self):
+        return f'Stage(name={self.name}, concurrency={self.concurrency}, batch_size={self.batch_size}, batched={self.batched})'
+
+
+class Pipeline:
+    """
+    Runs stages concurrently so every trend moves to its next stage as soon as its prerequisites are filled.
+
+    Each poll, every stage with free capacity picks up eligible trends that are not already in flight,
+    so text generation, image generation and WordPress uploads for different trends overlap instead of
+    each stage draining its whole queue before the next one starts. Every stage has its own
+    `UnitOfWork`; results are buffered there and written with bulk UPDATEs once `commit_batch_size`
+    have arrived, a poll interval has passed, or the stage goes idle. A trend that fails in a stage is
+    skipped by that stage for the rest of the run. Stage sessions hand their connection back to the pool
+    after every claim, prepare and apply, so the number of stages is not limited by the pool size.
+
+    Args:
+        stages (List[Stage]): The stages to run.
+        poll_interval (float, optional): Seconds between looks for newly eligible trends. Defaults to `pipeline_poll_interval` from the config.
+        batch_size (int, optional): Buffered updates per stage before they are written. Defaults to `commit_batch_size` from the config.
+    """
+
+    def __init__(self, stages: List[Stage], poll_interval: float = pipeline_poll_interval, batch_size: int = commit_batch_size) -> None:
+        self.stages: List[Stage] = stages
+        self.poll_interval: float = poll_interval
+        self.units: Dict[str, UnitOfWork] = {stage.name: UnitOfWork(batch_size) for stage in stages}
+        self.tasks: Set[asyncio.Task] = set()
+        self.wake: Optional[asyncio.Event] = None
+        self.stopped: Optional[asyncio.Event] = None
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=sum(stage.concurrency for stage in stages))
+
+    def _create_events(self) -> None:
+        # asyncio events must be created inside the running loop on Python 3.8.
+        if self.wake is None:
+            self.wake = asyncio.Event()
+            self.stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        """
+        Stops dispatching new work. `run` returns once the work already in flight has been applied.
+
+        Returns:
+            None
+        """
+        if not self.stopped.is_set():
+            print(f"Stopping, waiting for {len(self.tasks)} task(s) in flight.")
+        self.stopped.set()
+        self.wake.set()
+
+    def retry_failed(self) -> None:
+        """
+        Makes trends that failed in a stage eligible for that stage again.
+
+        Returns:
+            None
+        """
+        for stage in self.stages:
+            stage.failed.clear()
+        if self.wake is not None:
+            self.wake.set()
+
+    def _claim(self, stage: Stage) -> List[Trend]:
+        free: int = stage.concurrency - stage.running
+        if free <= 0:
+            return []
+        unit: UnitOfWork = self.units[stage.name]
+        query: Query = unit.query(stage.pending())
+        excluded: Set[int] = stage.in_flight | stage.failed | set(unit.pending_ids())
+        if excluded:
+            query = query.filter(Trend.id.notin_(excluded))
+        try:
+            return query.order_by(Trend.id).limit(free * stage.batch_size).populate_existing().all()
+        finally:
+            unit.release()
+
+    async def _run(self, stage: Stage, trends: List[Trend]) -> None:
+        loop = asyncio.get_event_loop()
+        unit: UnitOfWork = self.units[stage.name]
+        ids: List[int] = [trend.id for trend in trends]
+        try:
+            payloads: List[Any] = [stage.prepare(trend) for trend in trends]
+            unit.release()
+            with stage_seconds.time(stage=stage.name):
+                if stage.batched:
+                    results: List[Any] = await loop.run_in_executor(self.executor, stage.work, payloads)
+                else:
+                    results = [await loop.run_in_executor(self.executor, stage.work, payloads[0])]
+            for trend_id, result in zip(ids, results):
+                trend: Optional[Trend] = unit.session.get(Trend, trend_id)
+                row: TrendUpdate = unit.apply(trend, stage.apply, result)
+                if "pipeline_state" not in row:
+                    # The result did not move the trend on (e.g. an empty completion); don't retry it in a loop.
+                    stage.failed.add(trend_id)
+                trends_processed.inc(stage=stage.name, result="ok" if "pipeline_state" in row else "failed")
+        except Exception as e:
+            unit.session.rollback()
+            failed: List[int] = [trend_id for trend_id in ids if trend_id not in unit.pending_ids()]
+            stage.failed.update(failed)
+            trends_processed.inc(len(failed), stage=stage.name, result="failed")
+            print(f"{stage.name}: {e}")
+        finally:
+            stage.running -= 1
+            stage.in_flight.difference_update(ids)
+            if unit.full:
+                self._flush(stage)
+            else:
+                unit.release()
+            self.wake.set()
+
+    def _flush(self, stage: Stage) -> int:
+        unit: UnitOfWork = self.units[stage.name]
+        written: int = len(unit.pending_ids())
+        stage.failed.update(unit.flush())
+        return written
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Writes the buffered updates of every stage that is full, idle or has waited a poll interval.
+
+        Args:
+            force (bool, optional): Write every stage's buffer regardless. Defaults to False.
+
+        Returns:
+            int: The number of trend updates written.
+        """
+        written: int = 0
+        for stage in self.stages:
+            unit: UnitOfWork = self.units[stage.name]
+            if unit.pending_ids() and (force or unit.full or not stage.running or unit.age() >= self.poll_interval):
+                written += self._flush(stage)
+        if written and self.wake is not None:
+            # Flushed trends may be eligible for the next stage now.
+            self.wake.set()
+        return written
+
+    def dispatch(self) -> int:
+        """
+        Starts work for every stage that has free capacity and eligible trends.
+
+        Returns:
+            int: The number of tasks started.
+        """
+        started: int = 0
+        for stage in self.stages:
+            trends: List[Trend] = self._claim(stage)
+            for start in range(0, len(trends), stage.batch_size):
+                batch: List[Trend] = trends[start:start + stage.batch_size]
+                stage.running += 1
+                stage.in_flight.update(trend.id for trend in batch)
+                task: asyncio.Task = asyncio.ensure_future(self._run(stage, batch))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+                started += 1
+        return started
+
+    async def run(self, forever: bool = False) -> None:
+        """
+        Runs until no stage has eligible trends left and no work is in flight.
+
+        Args:
+            forever (bool, optional): Keep waiting for newly eligible trends until `stop` is called. Defaults to False.
+
+        Returns:
+            None
+        """
+        self._create_events()
+        try:
+            while True:
+                self.wake.clear()
+                self.flush()
+                started: int = 0 if self.stopped.is_set() else self.dispatch()
+                if not started and not self.tasks and not self.flush(force=True) and (self.stopped.is_set() or not forever):
+                    break
+                try:
+                    await asyncio.wait_for(self.wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.executor.shutdown(wait=True)
+            self.flush(force=True)
+            for unit in self.units.values():
+                unit.close()
+        for stage in self.stages:
+            if stage.failed:
+                print(f"{stage.name}: {len(stage.failed)} trend(s) failed and will be retried on the next run.")
+
+
+def run_pipeline(stages: List[Stage]) -> None:
+    """
+    Runs the given stages as an async pipeline until all eligible trends have been processed.
+
+    Args:
+        stages (List[Stage]): The stages to run.
+
+    Returns:
+        None
+    """
+    asyncio.run(Pipeline(stages).run())
+
+
+async def _run_daemon(pipeline: Pipeline, cycle: Callable[[], Awaitable[Any]], interval: float) -> None:
+    loop = asyncio.get_event_loop()
+    pipeline._create_events()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, pipeline.stop)
+        except NotImplementedError:
+            pass
+
+    async def schedule() -> None:
+        while not pipeline.stopped.is_set():
+            try:
+                await cycle()
+            except Exception as e:
+                session.rollback()
+                print(f"Scheduled cycle failed: {e}")
+            pipeline.retry_failed()
+            try:
+                await asyncio.wait_for(pipeline.stopped.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    scheduler: asyncio.Task = asyncio.ensure_future(schedule())
+    await pipeline.run(forever=True)
+    scheduler.cancel()
+
+
+def run_daemon(stages: List[Stage], cycle: Callable[[], Awaitable[Any]], interval: float = daemon_interval) -> None:
+    """
+    Runs the pipeline continuously, calling `cycle` every `interval` seconds, until SIGINT or SIGTERM.
+
+    `cycle` is meant to ingest new trends and refresh caches; the pipeline picks up every row as soon as it
+    becomes eligible, and trends that failed are retried once per cycle. Clients, caches and the image
+    model stay loaded for the lifetime of the process. On a signal no new work is started and the
+    daemon exits once the work in flight has been written back.
+
+    Args:
+        stages (List[Stage]): The stages to run.
+        cycle (Callable[[], Awaitable[Any]]): A coroutine function run on the event loop once per interval.
+        interval (float, optional): Seconds between cycles. Defaults to `daemon_interval` from the config.
+
+    Returns:
+        None
+    """
+    asyncio.run(_run_daemon(Pipeline(stages), cycle, interval))
@@ -0,0 +1,247 @@
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Mapping, Optional
+from config import rate_limits
+from metrics import external_call_seconds, external_calls
+
+DEFAULT_RATE_LIMITS: Dict[str, Dict[str, float]] = {
+    "openai": {"requests_per_minute": 60, "tokens_per_minute": 90000},
+    "wordpress": {"requests_per_minute": 120},
+    "reddit": {"requests_per_minute": 60},
+}
+RETRY_STATUS_CODES = (429, 503)
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that refills continuously up to its capacity.
+
+    Args:
+        per_minute (float): The number of tokens added per minute; also the bucket capacity.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity: float = float(per_minute)
+        self.rate: float = self.capacity / 60.0
+        self.tokens: float = self.capacity
+        self.updated: float = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1) -> None:
+        """
+        Blocks until `amount` tokens are available and takes them.
+
+        Args:
+            amount (float, optional): The number of tokens to take. Clamped to the bucket capacity. Defaults to 1.
+
+        Returns:
+            None
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now: float = time.monotonic()
+                self._refill(now)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return None
+                wait: float = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def empty_for(self, seconds: float) -> None:
+        """
+        Empties the bucket so no tokens become available for roughly `seconds`.
+
+        Args:
+            seconds (float): How long callers should wait.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a wait time from a rate-limit header.
+
+    Understands plain seconds ("30"), OpenAI reset durations ("1s", "6m0s", "20ms") and HTTP dates.
+
+    Args:
+        value (Optional[str]): The header value.
+
+    Returns:
+        Optional[float]: The wait in seconds, or None if the value could not be parsed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        scale: Dict[str, float] = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def response_status(obj: Any) -> Optional[int]:
+    """
+    Extracts an HTTP status code from a response or an API client exception.
+
+    Args:
+        obj (Any): A `requests.Response`, an `openai.error.OpenAIError`, a `prawcore` exception or anything else.
+
+    Returns:
+        Optional[int]: The status code, or None if there is none.
+    """
+    status = getattr(obj, "status_code", None) or getattr(obj, "http_status", None)
+    if status is None:
+        status = getattr(getattr(obj, "response", None), "status_code", None)
+    return status
+
+
+def response_headers(obj: Any) -> Mapping[str, str]:
+    """
+    Extracts HTTP headers from a response or an API client exception.
+
+    Args:
+        obj (Any): A `requests.Response`, an `openai.error.OpenAIError`, a `prawcore` exception or anything else.
+
+    Returns:
+        Mapping[str, str]: The headers, or an empty mapping if there are none.
+    """
+    headers = getattr(obj, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(obj, "response", None), "headers", None)
+    return headers or {}
+
+
+class ServiceLimiter:
+    """
+    Paces and retries calls to one external service.
+
+    Every call takes one request token and, optionally, an estimated number of model tokens.
+    When the service answers 429/503 (as a response or as an exception) the limiter waits for
+    the time announced in `Retry-After`/`x-ratelimit-reset-*` headers, or backs off exponentially,
+    and lowers its request rate. Each success raises the rate again towards the configured limit,
+    so throughput settles just below what the provider accepts.
+
+    Args:
+        name (str): The service name, used in log messages.
+        requests_per_minute (float): The configured request budget.
+        tokens_per_minute (Optional[float], optional): The configured token budget, if the service meters tokens. Defaults to None.
+        max_retries (int, optional): How many times a throttled call is retried. Defaults to 5.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: Optional[float] = None, max_retries: int = 5) -> None:
+        self.name: str = name
+        self.max_rate: float = float(requests_per_minute)
+        self.requests: TokenBucket = TokenBucket(requests_per_minute)
+        self.tokens: Optional[TokenBucket] = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries: int = max_retries
+
+    def _set_rate(self, per_minute: float) -> None:
+        with self.requests.lock:
+            self.requests.rate = max(1.0, min(self.max_rate, per_minute)) / 60.0
+
+    def _throttled(self, obj: Any, attempt: int) -> None:
+        headers: Mapping[str, str] = response_headers(obj)
+        wait: Optional[float] = None
+        for header in ("Retry-After", "retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+            wait = parse_duration(headers.get(header))
+            if wait is not None:
+                break
+        if wait is None:
+            wait = min(60.0, 2.0 ** attempt)
+        self._set_rate(self.requests.rate * 60.0 / 2)
+        self.requests.empty_for(wait)
+        print(f"{self.name} is throttling requests, waiting {wait:.1f}s (attempt {attempt + 1}).")
+
+    def _observe(self, obj: Any) -> None:
+        headers: Mapping[str, str] = response_headers(obj)
+        remaining: Optional[str] = headers.get("x-ratelimit-remaining-requests")
+        if remaining is not None and remaining.strip() == "0":
+            wait: Optional[float] = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if wait:
+                self.requests.empty_for(wait)
+        self._set_rate(self.requests.rate * 60.0 + 1)
+
+    def call(self, func: Callable[..., Any], *args: Any, tokens: float = 0, **kwargs: Any) -> Any:
+        """
+        Calls `func(*args, **kwargs)` within this service's budget, retrying while the service throttles.
+
+        Args:
+            func (Callable[..., Any]): The outbound call, e.g. `requests.post` or `openai.Completion.create`.
+            *args (Any): Positional arguments for `func`.
+            tokens (float, optional): The estimated model tokens the call consumes. Defaults to 0.
+            **kwargs (Any): Keyword arguments for `func`.
+
+        Returns:
+            Any: Whatever `func` returns. A throttled response is returned as-is once retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.requests.acquire()
+            if self.tokens is not None and tokens:
+                self.tokens.acquire(tokens)
+            start: float = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                external_call_seconds.observe(time.perf_counter() - start, service=self.name)
+                external_calls.inc(service=self.name, status=str(response_status(e) or "error"))
+                if response_status(e) in RETRY_STATUS_CODES and attempt < self.max_retries:
+                    self._throttled(e, attempt)
+                    continue
+                raise
+            external_call_seconds.observe(time.perf_counter() - start, service=self.name)
+            external_calls.inc(service=self.name, status=str(response_status(result) or "ok"))
+            if response_status(result) in RETRY_STATUS_CODES and attempt < self.max_retries:
+                self._throttled(result, attempt)
+                continue
+            self._observe(result)
+            return result
+        return result
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """
+    Estimates the tokens a completion request consumes (about four characters per prompt token).
+
+    Args:
+        prompt (str): The prompt text.
+        max_tokens (int): The completion's `max_tokens`.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return len(prompt) // 4 + max_tokens
+
+
+def _build_limiter(name: str) -> ServiceLimiter:
+    settings: Dict[str, float] = dict(DEFAULT_RATE_LIMITS[name])
+    settings.update(rate_limits.get(name, {}))
+    return ServiceLimiter(
+        name,
+        requests_per_minute=settings["requests_per_minute"],
+        tokens_per_minute=settings.get("tokens_per_minute"),
+        max_retries=int(settings.get("max_retries", 5)),
+    )
+
+
+openai_limiter: ServiceLimiter = _build_limiter("openai")
+wordpress_limiter: ServiceLimiter = _build_limiter("wordpress")
+reddit_limiter: ServiceLimiter = _build_limiter("reddit")
@@ -0,0 +1,146 @@
+import html
+import threading
+import requests
+from typing import Any, Dict, List, Optional
+from sqlalchemy.orm import Session as DatabaseSession
+from config import tags_url
+from models import Session, WordPressTag, session
+from wordpress import wordpress
+
+TAGS_PER_PAGE = 100
+# Held while a missing tag is created, so two threads never create or index the same tag at once.
+_create_lock = threading.Lock()
+
+
+def normalize_tag(name: str) -> str:
+    """
+    Normalizes a tag name for matching: unescapes HTML entities, drops leading hashes, case-folds and collapses whitespace.
+
+    Args:
+        name (str): A tag name as generated or as returned by WordPress.
+
+    Returns:
+        str: The normalized name.
+    """
+    return " ".join(html.unescape(name).strip().lstrip("#").casefold().split())
+
+
+def _store(tags: List[Dict[str, Any]], db: DatabaseSession = session, crawled: bool = False) -> None:
+    for tag in tags:
+        # Tags stored without `crawled` keep the flag they already have.
+        flags: Dict[str, bool] = {"crawled": True} if crawled else {}
+        db.merge(WordPressTag(id=tag["id"], name=tag["name"], normalized_name=normalize_tag(tag["name"]), **flags))
+
+
+def _fetch_page(page: int) -> requests.Response:
+    params: Dict[str, Any] = {'per_page': TAGS_PER_PAGE, 'page': page, 'orderby': 'id', 'order': 'desc', '_fields': 'id,name'}
+    return wordpress.get(tags_url, params=params)
+
+
+def refresh_tag_index() -> int:
+    """
+    Brings the local tag index up to date with WordPress.
+
+    Tags are fetched newest first, 100 per page, and paging stops at the newest tag an earlier crawl
+    indexed. Tags recorded by `create_tag` don't count, so tags created in WordPress before them are still
+    picked up. The first run therefore crawls every tag once and later runs usually need a single request.
+    WordPress has no modified-since filter for tags, so renamed tags are picked up when they are next created or looked up.
+
+    Returns:
+        int: The number of tags added to the index.
+    """
+    known_max_id: Optional[int] = (
+        session.query(WordPressTag.id).filter(WordPressTag.crawled.is_(True)).order_by(WordPressTag.id.desc()).limit(1).scalar()
+    )
+    new_tags: List[Dict[str, Any]] = []
+    page: int = 1
+    while True:
+        response: requests.Response = _fetch_page(page)
+        if response.status_code != 200:
+            # Storing a partial crawl would hide the older, unfetched tags from later incremental refreshes.
+            print(f"Error fetching tags: {response.status_code}")
+            return 0
+        tags: List[Dict[str, Any]] = response.json()
+        page_new_tags: List[Dict[str, Any]] = [tag for tag in tags if known_max_id is None or tag["id"] > known_max_id]
+        new_tags.extend(page_new_tags)
+        if len(page_new_tags) < len(tags) or page >= int(response.headers.get('X-WP-TotalPages', page)):
+            break
+        page += 1
+    _store(new_tags, crawled=True)
+    session.flush()
+    print(f"Tag index refreshed, {len(new_tags)} new tags.")
+    return len(new_tags)
+
+
+def lookup_tag(name: str, db: DatabaseSession = session) -> Optional[int]:
+    """
+    Finds the WordPress ID of a tag in the local index, ignoring case, whitespace and HTML escaping.
+
+    Args:
+        name (str): The tag name.
+        db (DatabaseSession, optional): The session to query. Defaults to the shared session.
+
+    Returns:
+        Optional[int]: The tag ID, or None if the tag is not indexed.
+    """
+    return db.query(WordPressTag.id).filter(WordPressTag.normalized_name == normalize_tag(name)).limit(1).scalar()
+
+
+def create_tag(name: str, db: DatabaseSession = session) -> Optional[int]:
+    """
+    Creates a tag on WordPress and records it in the local index.
+
+    Args:
+        name (str): The tag name.
+        db (DatabaseSession, optional): The session the new tag is recorded in. Defaults to the shared session.
+
+    Returns:
+        Optional[int]: The ID of the new tag (or of the existing tag WordPress reports), or None on failure.
+    """
+    response: requests.Response = wordpress.post("tags", json={'name': name})
+    body: Dict[str, Any] = response.json()
+    if response.status_code == 201:
+        _store([body], db)
+        return body["id"]
+    if body.get("code") == "term_exists":
+        tag_id: int = body["data"]["term_id"]
+        _store([{"id": tag_id, "name": name}], db)
+        return tag_id
+    print(f"Error creating tag {name}: {body}")
+    return None
+
+
+def ensure_tag_ids(tag_names: List[str]) -> List[int]:
+    """
+    Maps tag names to WordPress tag IDs using the local index, creating the tags that do not exist yet.
+
+    Safe to call from worker threads: the index is read through a session of its own, and missing tags
+    are created one at a time, so a tag two articles share is only created once.
+
+    Args:
+        tag_names (List[str]): The tag names of an article.
+
+    Returns:
+        List[int]: The IDs of all tags that exist or could be created, without duplicates.
+    """
+    tag_ids: List[int] = []
+    db: DatabaseSession = Session()
+    try:
+        for tag in tag_names:
+            tag_ = tag.strip()
+            if not normalize_tag(tag_):
+                continue
+            tag_id: Optional[int] = lookup_tag(tag_, db)
+            if tag_id is None:
+                with _create_lock:
+                    # Another thread may have created the tag while this one waited for the lock.
+                    tag_id = lookup_tag(tag_, db)
+                    if tag_id is None:
+                        tag_id = create_tag(tag_, db)
+                        # Stages write trends through their own sessions; don't hold the database's write lock here.
+                        db.commit()
+            if tag_id is not None and tag_id not in tag_ids:
+                tag_ids.append(tag_id)
+    finally:
+        db.close()
+    return tag_ids
@@ -0,0 +1,195 @@
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import insert, inspect, update
+from sqlalchemy.orm import Query
+from config import commit_batch_size
+from metrics import flush_seconds
+from models import Session, Trend, TrendContent
+
+TrendUpdate = Dict[str, Any]
+# (is_new, {"trend_id": ..., column: value}) for a row of `trend_contents`.
+ContentUpdate = Tuple[bool, Dict[str, Any]]
+
+
+class UnitOfWork:
+    """
+    A database session of its own plus a buffer of trend updates written with bulk UPDATE statements.
+
+    Stage results are applied to ORM objects as before, but instead of being flushed one object at a
+    time the changed columns are turned into plain `{"id": ..., column: value}` rows. `flush` writes
+    the buffer with one executemany UPDATE per set of changed columns and commits; article bodies set
+    through `Trend.article` are inserted into or updated in `trend_contents` the same way. If that
+    fails, the trends are retried one by one so a single bad row is reported instead of rolling back
+    the batch.
+
+    Loaded trends stay usable after a commit, so callers can `release` the session's connection
+    between queries instead of holding one for as long as the unit is open.
+
+    Args:
+        batch_size (int, optional): Buffered updates that make the unit `full`. Defaults to `commit_batch_size` from the config.
+    """
+
+    def __init__(self, batch_size: int = commit_batch_size) -> None:
+        self.session = Session(expire_on_commit=False)
+        self.batch_size: int = max(1, batch_size)
+        self.pending: List[TrendUpdate] = []
+        self.pending_contents: List[ContentUpdate] = []
+        self.first_pending: Optional[float] = None
+
+    def __enter__(self) -> 'UnitOfWork':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.flush()
+        self.close()
+
+    @property
+    def full(self) -> bool:
+        return len(self.pending_ids()) >= self.batch_size
+
+    def age(self) -> float:
+        """
+        Returns how many seconds the oldest buffered update has been waiting, or 0 if nothing is buffered.
+        """
+        return time.monotonic() - self.first_pending if self.first_pending is not None else 0.0
+
+    def pending_ids(self) -> List[int]:
+        ids: Dict[int, None] = dict.fromkeys(row["id"] for row in self.pending)
+        ids.update(dict.fromkeys(content["trend_id"] for _, content in self.pending_contents))
+        return list(ids)
+
+    @staticmethod
+    def _changes(instance: Any) -> Dict[str, Any]:
+        state = inspect(instance)
+        changes: Dict[str, Any] = {}
+        for column in state.mapper.column_attrs:
+            added = state.attrs[column.key].history.added
+            if added:
+                changes[column.key] = added[0]
+        return changes
+
+    def query(self, query: Query) -> Query:
+        """
+        Binds a query built on the shared session to this unit's session.
+
+        Args:
+            query (Query): E.g. `trends_pending_title()`.
+
+        Returns:
+            Query: The same query, run with this unit's session.
+        """
+        return query.with_session(self.session)
+
+    def apply(self, trend: Trend, apply: Callable[[Trend, Any], None], result: Any) -> TrendUpdate:
+        """
+        Runs a stage's apply function on a trend and moves the columns it changed into the buffer.
+
+        The trend itself is expired (and a new `TrendContent` expunged), so it is never flushed through the ORM.
+
+        Args:
+            trend (Trend): A trend loaded through this unit's session.
+            apply (Callable[[Trend, Any], None]): The stage's apply function, e.g. `apply_article_title`.
+            result (Any): The result to apply.
+
+        Returns:
+            TrendUpdate: The buffered row: the trend id and every column that changed.
+        """
+        apply(trend, result)
+        row: TrendUpdate = {"id": trend.id, **self._changes(trend)}
+        content: Optional[TrendContent] = trend.__dict__.get("content")
+        if content is not None:
+            values: Dict[str, Any] = self._changes(content)
+            is_new: bool = inspect(content).pending
+            if is_new:
+                self.session.expunge(content)
+            else:
+                self.session.expire(content)
+            if is_new or values:
+                self.pending_contents.append((is_new, {**values, "trend_id": trend.id}))
+        self.session.expire(trend)
+        if len(row) > 1:
+            self.pending.append(row)
+        if self.first_pending is None and (self.pending or self.pending_contents):
+            self.first_pending = time.monotonic()
+        return row
+
+    def applier(self, apply: Callable[[Trend, Any], None]) -> Callable[[Trend, Any], None]:
+        """
+        Wraps a stage's apply function so results are buffered and flushed every `batch_size` trends.
+
+        Args:
+            apply (Callable[[Trend, Any], None]): The stage's apply function.
+
+        Returns:
+            Callable[[Trend, Any], None]: A function with the same signature, e.g. for `fan_out`.
+        """
+        def apply_buffered(trend: Trend, result: Any) -> None:
+            self.apply(trend, apply, result)
+            if self.full:
+                self.flush()
+        return apply_buffered
+
+    def _write(self, rows: List[TrendUpdate], contents: List[ContentUpdate]) -> None:
+        # One executemany per column set; SQLAlchemy's bulk UPDATE needs the same keys in every row.
+        by_columns: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_columns.setdefault(tuple(sorted(row)), []).append(row)
+        for group in by_columns.values():
+            self.session.execute(update(Trend), group)
+        new_contents: List[Dict[str, Any]] = [values for is_new, values in contents if is_new]
+        if new_contents:
+            self.session.execute(insert(TrendContent), new_contents)
+        changed_contents: List[Dict[str, Any]] = [values for is_new, values in contents if not is_new]
+        if changed_contents:
+            self.session.execute(update(TrendContent), changed_contents)
+        self.session.commit()
+
+    def flush(self) -> List[int]:
+        """
+        Writes and commits the buffered updates.
+
+        Returns:
+            List[int]: The ids of trends whose update could not be written; they keep their previous values.
+        """
+        ids: List[int] = self.pending_ids()
+        rows: List[TrendUpdate] = self.pending
+        contents: List[ContentUpdate] = self.pending_contents
+        self.pending = []
+        self.pending_contents = []
+        self.first_pending = None
+        if not ids:
+            return []
+        try:
+            with flush_seconds.time():
+                self._write(rows, contents)
+            return []
+        except Exception as e:
+            self.session.rollback()
+            print(f"Bulk update of {len(ids)} trends failed, retrying one by one: {e}")
+
+        failed: List[int] = []
+        for trend_id in ids:
+            try:
+                self._write(
+                    [row for row in rows if row["id"] == trend_id],
+                    [content for content in contents if content[1]["trend_id"] == trend_id],
+                )
+            except Exception as e:
+                self.session.rollback()
+                failed.append(trend_id)
+                print(f"Error updating trend {trend_id}: {e}")
+        return failed
+
+    def release(self) -> None:
+        """
+        Ends the session's transaction, returning its connection to the pool. Loaded trends keep their values.
+
+        Returns:
+            None
+        """
+        if self.session.in_transaction():
+            self.session.commit()
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,88 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Any
+from config import api_base_url, auth_header, wordpress_pool_size, wordpress_timeout, wordpress_max_retries
+from rate_limit import wordpress_limiter
+
+
+class WordPressClient:
+    """
+    A keep-alive client for the WordPress REST API.
+
+    All requests share one `requests.Session` with a connection pool, so consecutive calls reuse
+    open TCP/TLS connections. Every request carries the Basic auth header from the config, a
+    timeout, and goes through the WordPress rate limiter. Connection errors and 502/504 answers to
+    idempotent requests are retried by urllib3; 429/503 throttling is handled by the rate limiter.
+    File objects passed as `data` are streamed from disk and rewound before every attempt.
+
+    Args:
+        base_url (str, optional): The REST API root, e.g. "https://example.com/wp-json/wp/v2/". Defaults to `api_base_url` from the config.
+        pool_size (int, optional): Connections kept open to the host. Defaults to `wordpress_pool_size` from the config.
+        timeout (float, optional): Seconds to wait for a connection or response. Defaults to `wordpress_timeout` from the config.
+        max_retries (int, optional): Retries for failed connections and gateway errors. Defaults to `wordpress_max_retries` from the config.
+    """
+
+    def __init__(
+        self,
+        base_url: str = api_base_url,
+        pool_size: int = wordpress_pool_size,
+        timeout: float = wordpress_timeout,
+        max_retries: int = wordpress_max_retries,
+    ) -> None:
+        self.base_url: str = base_url
+        self.timeout: float = timeout
+        self.session: requests.Session = requests.Session()
+        self.session.headers.update({"Authorization": f"Basic {auth_header}"})
+        retry: Retry = Retry(total=max_retries, backoff_factor=0.5, status_forcelist=(502, 504))
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path: str) -> str:
+        """
+        Resolves an endpoint path against the REST API root.
+
+        Args:
+            path (str): A path such as "posts/12", or an absolute URL which is returned unchanged.
+
+        Returns:
+            str: The absolute URL.
+        """
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}{path}"
+
+    def request(self, method: str, path: str, **kwargs: Any) -> requests.Response:
+        """
+        Sends a request through the pooled session and the WordPress rate limiter.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The endpoint path or absolute URL.
+            **kwargs (Any): Arguments for `requests.Session.request`, e.g. `json`, `data`, `params` or `headers`.
+
+        Returns:
+            requests.Response: The response.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return wordpress_limiter.call(self._send, method, self.url(path), **kwargs)
+
+    def _send(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        body: Any = kwargs.get("data")
+        if hasattr(body, "seek"):
+            # A throttled upload is retried with the same file object; send it from the start again.
+            body.seek(0)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, path: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs: Any) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+
+wordpress: WordPressClient = WordPressClient()
@@ -0,0 +1,30 @@
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+PACKAGE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'chatgpt_to_wordpress')
+sys.path.insert(0, PACKAGE_PATH)
+
+# The package reads its config on import, so the tests write a throwaway one with a database of their own
+# before any test module imports it; a config.json in the checkout is never used or needed.
+TEST_DIRECTORY: str = tempfile.mkdtemp(prefix="chatgpt_to_wordpress_tests_")
+atexit.register(shutil.rmtree, TEST_DIRECTORY, True)
+TEST_CONFIG: dict = {
+    "client_id": "test",
+    "client_secret": "test",
+    "user_agent": "test",
+    "refresh_token": "test",
+    "openapi_key": "test-key",
+    "application_password": "test",
+    "api_base_url": "http://127.0.0.1:9/wp-json/wp/v2/",
+    "username": "test",
+    "tags_url": "http://127.0.0.1:9/wp-json/wp/v2/tags",
+    "database_url": f"sqlite:///{os.path.join(TEST_DIRECTORY, 'trends.db')}",
+    "completion_cache_enabled": False,
+}
+with open(os.path.join(TEST_DIRECTORY, 'config.json'), 'w') as config_file:
+    json.dump(TEST_CONFIG, config_file)
+os.environ["CHATGPT_TO_WORDPRESS_CONFIG"] = os.path.join(TEST_DIRECTORY, 'config.json')
@@ -0,0 +1,21 @@
+import unittest
+
+from dedup import NearDuplicateIndex
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+    def test_near_duplicate_is_matched(self):
+        index = NearDuplicateIndex(window=10, threshold=0.8)
+        results = index.check([(1, "OpenAI releases a new ChatGPT model"), (2, "OpenAI releases new ChatGPT model")])
+        self.assertIsNone(results[0])
+        self.assertEqual(results[1][0], 1)
+
+    def test_recheck_does_not_match_itself(self):
+        index = NearDuplicateIndex(window=10, threshold=0.8)
+        index.check([(7, "Solar panels on every new home")])
+        self.assertEqual(index.check([(7, "Solar panels on every new home")]), [None])
+        self.assertEqual(len(index), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import threading
+import unittest
+from multiprocessing.connection import Listener
+
+from image_worker import connection_authkey, parse_address, request_images
+from tests import TEST_DIRECTORY
+
+
+class TestConnectionAuthkey(unittest.TestCase):
+    def test_tcp_needs_a_key(self):
+        with self.assertRaises(ValueError):
+            connection_authkey(parse_address("0.0.0.0:6000"), b"")
+        with self.assertRaises(ValueError):
+            request_images([], address="localhost:6000")
+        self.assertEqual(connection_authkey(parse_address("localhost:6000"), b"secret"), b"secret")
+
+    def test_unix_socket_may_go_without_a_key(self):
+        self.assertIsNone(connection_authkey(parse_address("/run/image_worker.sock"), b""))
+
+    def test_request_over_unix_socket(self):
+        path: str = os.path.join(TEST_DIRECTORY, "image_worker.sock")
+        with Listener(path, authkey=None) as listener:
+            def answer() -> None:
+                with listener.accept() as conn:
+                    request = conn.recv()
+                    conn.send({"ok": True, "files": [[job["filename"]] for job in request["jobs"]]})
+
+            worker = threading.Thread(target=answer)
+            worker.start()
+            reply = request_images([{"prompt": "solar", "filename": "/tmp/1.png"}], address=path)
+            worker.join()
+        self.assertEqual(reply, {"ok": True, "files": [["/tmp/1.png"]]})
+
+
+if __name__ == '__main__':
+    unittest.main()
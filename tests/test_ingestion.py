@@ -0,0 +1,56 @@
+import unittest
+from types import SimpleNamespace
+from typing import List
+
+from ingestion import fetch_new_submissions, get_cursor, store_submissions
+from models import Session, SubredditCursor, Trend, TrendContent
+
+
+def submission(number: int) -> SimpleNamespace:
+    return SimpleNamespace(fullname=f"t3_{number}", created_utc=1000.0 + number, title=f"Submission {number}")
+
+
+class FakeSubreddit:
+    """Lists submissions 1 to `newest`, newest first, like `Subreddit.new`."""
+
+    def __init__(self, newest: int) -> None:
+        self.newest: int = newest
+
+    def new(self, limit=None):
+        numbers: List[int] = list(range(self.newest, 0, -1))
+        return [submission(number) for number in (numbers if limit is None else numbers[:limit])]
+
+
+class TestIngestion(unittest.TestCase):
+    def setUp(self) -> None:
+        db = Session()
+        db.query(TrendContent).delete()
+        db.query(Trend).delete()
+        db.query(SubredditCursor).delete()
+        db.commit()
+        db.close()
+
+    def ingest(self, subreddit: FakeSubreddit, limit: int) -> List[str]:
+        submissions = fetch_new_submissions(subreddit, *get_cursor("test"), limit)
+        store_submissions("test", submissions)
+        return [item.fullname for item in submissions]
+
+    def test_first_run_takes_the_newest(self):
+        self.assertEqual(self.ingest(FakeSubreddit(5), 2), ["t3_5", "t3_4"])
+        self.assertEqual(get_cursor("test"), ("t3_5", 1005.0))
+
+    def test_backlog_is_ingested_oldest_first_without_gaps(self):
+        self.ingest(FakeSubreddit(2), 1)
+        subreddit = FakeSubreddit(6)
+        ingested: List[str] = []
+        for _ in range(5):
+            ingested += self.ingest(subreddit, 1)
+        self.assertEqual(ingested, ["t3_3", "t3_4", "t3_5", "t3_6"])
+        self.assertEqual(get_cursor("test"), ("t3_6", 1006.0))
+        db = Session()
+        self.assertEqual(db.query(Trend).count(), 5)
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
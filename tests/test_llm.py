@@ -0,0 +1,200 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+import llm
+import main
+from models import Session, Trend, TrendContent, TrendState
+
+
+class StubOpenAI(BaseHTTPRequestHandler):
+    """
+    Answers the completions, files and batches endpoints like the OpenAI API, from memory.
+
+    Completions answer "answer to <prompt>". A batch job reports "in_progress" on its first poll and
+    "completed" on the next; every request in it is answered with "done <prompt>", except prompts
+    containing "fail", which end up in the error file.
+    """
+
+    protocol_version = "HTTP/1.1"
+    requests: List[Dict[str, Any]] = []
+    batches: Dict[str, Dict[str, Any]] = {}
+    files: Dict[str, str] = {}
+
+    def _reply(self, status: int, body: Any, content_type: str = "application/json") -> None:
+        data: bytes = (body if isinstance(body, str) else json.dumps(body)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        self.requests.append({"method": "GET", "path": self.path})
+        if self.path.startswith("/v1/batches/"):
+            job: Optional[Dict[str, Any]] = self.batches.get(self.path.rsplit("/", 1)[1])
+            if job is None:
+                return self._reply(404, {"error": {"message": "No such batch"}})
+            job["polls"] += 1
+            status: str = "completed" if job["polls"] > 1 else "in_progress"
+            return self._reply(200, {
+                "id": job["id"],
+                "status": status,
+                "output_file_id": job["output_file_id"] if status == "completed" else None,
+                "error_file_id": job["error_file_id"] if status == "completed" else None,
+                "request_counts": {"total": job["total"], "completed": job["total"] if status == "completed" else 0},
+            })
+        if self.path.startswith("/v1/files/") and self.path.endswith("/content"):
+            return self._reply(200, self.files[self.path.split("/")[3]], "application/jsonl")
+        self._reply(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self) -> None:
+        body: bytes = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.requests.append({"method": "POST", "path": self.path, "authorization": self.headers.get("Authorization")})
+        if self.path == "/v1/completions":
+            request: Dict[str, Any] = json.loads(body)
+            self.requests[-1]["json"] = request
+            return self._reply(200, {
+                "choices": [{"text": f" answer to {request['prompt']}\n"}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 4},
+            })
+        if self.path == "/v1/files":
+            # The JSONL part of the multipart upload is the only part with one JSON object per line.
+            lines: List[str] = [line for line in body.decode("utf-8").splitlines() if line.startswith('{"custom_id"')]
+            file_id: str = f"file-{len(self.files)}"
+            self.files[file_id] = "\n".join(lines)
+            return self._reply(200, {"id": file_id, "purpose": "batch"})
+        if self.path == "/v1/batches":
+            request = json.loads(body)
+            batch_id: str = f"batch-{len(self.batches)}"
+            output: List[str] = []
+            errors: List[str] = []
+            for line in self.files[request["input_file_id"]].splitlines():
+                item: Dict[str, Any] = json.loads(line)
+                prompt: str = item["body"]["prompt"]
+                if "fail" in prompt:
+                    errors.append(json.dumps({"custom_id": item["custom_id"], "response": {"status_code": 500, "body": {}}}))
+                else:
+                    output.append(json.dumps({"custom_id": item["custom_id"], "response": {
+                        "status_code": 200, "body": {"choices": [{"text": f"done {prompt}"}]},
+                    }}))
+            self.files[f"{batch_id}-output"] = "\n".join(output)
+            self.files[f"{batch_id}-errors"] = "\n".join(errors)
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "polls": 0,
+                "total": len(output) + len(errors),
+                "output_file_id": f"{batch_id}-output",
+                "error_file_id": f"{batch_id}-errors" if errors else None,
+            }
+            return self._reply(200, {"id": batch_id, "status": "validating"})
+        self._reply(404, {"error": {"message": "Not found"}})
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class LLMTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        StubOpenAI.requests = []
+        StubOpenAI.batches = {}
+        StubOpenAI.files = {}
+        self.server: ThreadingHTTPServer = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAI)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        client = llm.OpenAIClient(base_url=f"http://127.0.0.1:{self.server.server_port}/v1", api_key="test-key", timeout=5)
+        self.backend = llm.CompletionBackend(client, "test-model")
+        state = tempfile.TemporaryDirectory()
+        self.addCleanup(state.cleanup)
+        self.state_path: str = os.path.join(state.name, 'batches')
+        for patcher in (mock.patch.object(llm, "BATCH_STATE_PATH", self.state_path), mock.patch.object(llm, "time")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def posts(self, path: str) -> List[Dict[str, Any]]:
+        return [request for request in StubOpenAI.requests if request["method"] == "POST" and request["path"] == path]
+
+
+class TestCompletionBackend(LLMTestCase):
+    def test_complete(self):
+        self.assertEqual(self.backend.complete("Hello", 10, temperature=0.2), "answer to Hello")
+        request: Dict[str, Any] = self.posts("/v1/completions")[0]
+        self.assertEqual(request["authorization"], "Bearer test-key")
+        self.assertEqual(request["json"], {"model": "test-model", "prompt": "Hello", "max_tokens": 10, "n": 1, "temperature": 0.2})
+
+    def test_error_status_raises(self):
+        self.backend.endpoint = "missing"
+        with self.assertRaises(RuntimeError):
+            self.backend.complete("Hello", 10)
+
+
+class TestRunBatch(LLMTestCase):
+    def test_submit_poll_and_download(self):
+        results = llm.run_batch("title", [("title-1", "first", 10, 0.7), ("title-2", "fail this", 10, 0.7)], self.backend)
+
+        self.assertEqual(results, {"title-1": "done first", "title-2": None})
+        self.assertEqual(len(self.posts("/v1/files")), 1)
+        self.assertEqual(len(self.posts("/v1/batches")), 1)
+        self.assertEqual(StubOpenAI.batches["batch-0"]["polls"], 2)
+        self.assertFalse(os.path.exists(os.path.join(self.state_path, "title.json")))
+
+    def test_resume_from_state_file(self):
+        job_id: str = llm.submit_batch(self.backend, [("tags-1", "solar", 10, 0.7)])
+        os.makedirs(self.state_path)
+        with open(os.path.join(self.state_path, "tags.json"), 'w') as state_file:
+            json.dump({"id": job_id, "requests": 1}, state_file)
+
+        results = llm.run_batch("tags", [("tags-1", "solar", 10, 0.7)], self.backend)
+
+        self.assertEqual(results, {"tags-1": "done solar"})
+        self.assertEqual(len(self.posts("/v1/batches")), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.state_path, "tags.json")))
+
+    def test_nothing_to_submit(self):
+        self.assertEqual(llm.run_batch("excerpt", [], self.backend), {})
+        self.assertEqual(StubOpenAI.requests, [])
+
+
+class TestBatchGeneration(LLMTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        db = Session()
+        db.query(TrendContent).delete()
+        db.query(Trend).delete()
+        db.commit()
+        db.close()
+        for patcher in (
+            mock.patch.object(main, "get_backend", return_value=self.backend),
+            mock.patch.object(llm, "get_backend", return_value=self.backend),
+            mock.patch.object(main, "get_cache", return_value=None),
+            mock.patch.object(main, "generation_mode", "fields"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_batch_results_are_applied(self):
+        db = Session()
+        db.add_all([
+            Trend(trend_name="solar", trend_key="solar", pipeline_state=TrendState.UNIQUE),
+            Trend(trend_name="fail", trend_key="fail", pipeline_state=TrendState.UNIQUE),
+        ])
+        db.commit()
+
+        main.process_batch_generation("title")
+
+        db.expire_all()
+        trends: Dict[str, Any] = {trend.trend_name: trend for trend in db.query(Trend)}
+        self.assertIn("solar", trends["solar"].title)
+        self.assertEqual(trends["solar"].pipeline_state, TrendState.TITLED)
+        self.assertIsNone(trends["fail"].title)
+        self.assertEqual(trends["fail"].pipeline_state, TrendState.UNIQUE)
+        db.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+from typing import List
+from unittest import mock
+
+import llm
+import local_llm
+
+
+def run_together(target, count: int = 8) -> List[object]:
+    barrier = threading.Barrier(count)
+    results: List[object] = []
+
+    def run() -> None:
+        barrier.wait()
+        results.append(target())
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SlowPool:
+    created: int = 0
+
+    def __init__(self, *args, **kwargs) -> None:
+        time.sleep(0.05)
+        SlowPool.created += 1
+
+    def shutdown(self) -> None:
+        pass
+
+
+class TestLazyInitialisation(unittest.TestCase):
+    def test_one_process_pool_for_concurrent_callers(self):
+        SlowPool.created = 0
+        backend = local_llm.LocalBackend(model_path="model.gguf", workers=2)
+        with mock.patch.object(local_llm, "ProcessPoolExecutor", SlowPool):
+            pools = run_together(backend._pool)
+            backend.close()
+        self.assertEqual(SlowPool.created, 1)
+        self.assertEqual(len({id(pool) for pool in pools}), 1)
+
+    def test_one_api_backend_for_concurrent_callers(self):
+        def slow_client(*args, **kwargs):
+            time.sleep(0.05)
+            return mock.Mock()
+
+        with mock.patch.object(llm, "_backend", None), mock.patch.object(llm, "OpenAIClient", side_effect=slow_client) as client:
+            backends = run_together(llm.get_backend)
+        self.assertEqual(client.call_count, 1)
+        self.assertEqual(len({id(backend) for backend in backends}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
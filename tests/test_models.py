@@ -0,0 +1,27 @@
+import os
+import unittest
+
+from sqlalchemy import text
+
+from models import create_database_engine
+from tests import TEST_DIRECTORY
+
+
+class TestCreateDatabaseEngine(unittest.TestCase):
+    def test_in_memory_sqlite(self):
+        for url in ("sqlite://", "sqlite:///:memory:"):
+            engine = create_database_engine(url, pool_size=3)
+            with engine.connect() as connection:
+                self.assertEqual(connection.execute(text("SELECT 1")).scalar(), 1)
+            engine.dispose()
+
+    def test_sqlite_file_is_pooled(self):
+        engine = create_database_engine(f"sqlite:///{os.path.join(TEST_DIRECTORY, 'pooled.db')}", pool_size=3)
+        self.assertEqual(engine.pool.size(), 3)
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+from PIL import Image
+
+import main
+import media
+import tag_index
+from models import MediaUpload, Session, Trend, TrendContent, TrendState, WordPressTag
+from pipeline import Pipeline, Stage, run_pipeline
+from unit_of_work import UnitOfWork
+
+
+class FakeWordPress:
+    """
+    Answers the posts, tags and media endpoints like the WordPress REST API, from memory.
+
+    Every request is recorded as (method, path, body). Posts and media get ids from 100 and 900 up.
+    """
+
+    def __init__(self) -> None:
+        self.requests: List[tuple] = []
+        self.tags: List[Dict[str, Any]] = []
+        self.next_post_id: int = 100
+        self.next_media_id: int = 900
+
+    def _response(self, status_code: int, body: Any) -> mock.Mock:
+        response = mock.Mock(status_code=status_code, headers={"X-WP-TotalPages": "1"}, text="")
+        response.json.return_value = body
+        return response
+
+    def get(self, url: str, params: Dict[str, Any]) -> mock.Mock:
+        self.requests.append(("GET", url, params))
+        return self._response(200, sorted(self.tags, key=lambda tag: -tag["id"]))
+
+    def post(self, path: str, json: Optional[Dict[str, Any]] = None, data: Any = None, headers: Any = None) -> mock.Mock:
+        self.requests.append(("POST", path, json if json is not None else data))
+        if path == "posts":
+            self.next_post_id += 1
+            return self._response(201, {"id": self.next_post_id, "link": f"https://example.com/?p={self.next_post_id}"})
+        if path.startswith("posts/"):
+            post_id: int = int(path.split("/")[1])
+            return self._response(200, {"id": post_id, "link": f"https://example.com/?p={post_id}"})
+        if path == "tags":
+            tag: Dict[str, Any] = {"id": len(self.tags) + 1, "name": json["name"]}
+            self.tags.append(tag)
+            return self._response(201, tag)
+        if path == "media":
+            data.read()
+            self.next_media_id += 1
+            return self._response(201, {"id": self.next_media_id})
+        return self._response(404, {"code": "rest_no_route"})
+
+    def put(self, path: str, json: Dict[str, Any]) -> mock.Mock:
+        self.requests.append(("PUT", path, json))
+        post_id: int = int(path.split("/")[1])
+        return self._response(200, {"id": post_id, "link": f"https://example.com/?p={post_id}"})
+
+    def sent(self, method: str, path: str) -> List[Any]:
+        return [body for method_, path_, body in self.requests if method_ == method and path_ == path]
+
+
+class FakeBackend:
+    """Completes prompts from their text; prompts mentioning "broken" raise like a failed request."""
+
+    model: str = "stub-model"
+
+    def complete(self, prompt: str, max_tokens: int, temperature: float = 0.7) -> str:
+        if "broken" in prompt:
+            raise RuntimeError("completion failed")
+        if prompt.startswith("Write ten tags"):
+            return "energy, climate"
+        return f"Stub text for: {prompt}"
+
+
+def write_images(jobs: List[Dict[str, str]]) -> List[List[str]]:
+    for job in jobs:
+        Image.new("RGB", (64, 64), (len(job["filename"]) * 7 % 256, 120, 200)).save(job["filename"])
+    return [[job["filename"]] for job in jobs]
+
+
+class PipelineTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        db = Session()
+        for model in (TrendContent, Trend, WordPressTag, MediaUpload):
+            db.query(model).delete()
+        db.commit()
+        db.close()
+        main.session.rollback()
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+
+        self.wordpress: FakeWordPress = FakeWordPress()
+        for patcher in (
+            mock.patch.object(main, "wordpress", self.wordpress),
+            mock.patch.object(tag_index, "wordpress", self.wordpress),
+            mock.patch.object(media, "wordpress", self.wordpress),
+            mock.patch.object(main, "get_backend", return_value=FakeBackend()),
+            mock.patch.object(main, "get_cache", return_value=None),
+            mock.patch.object(main, "generate_images", side_effect=write_images),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def add_trends(self, *trends: Trend) -> None:
+        db = Session()
+        db.add_all(trends)
+        db.commit()
+        db.close()
+
+    def trends(self) -> Dict[str, Trend]:
+        db = Session(expire_on_commit=False)
+        trends: Dict[str, Trend] = {trend.trend_name: trend for trend in db.query(Trend)}
+        db.close()
+        return trends
+
+    def run_stages(self, publish_mode: str) -> None:
+        with mock.patch.object(main, "publish_mode", publish_mode):
+            stages: List[Stage] = main.pipeline_stages()
+            run_pipeline(stages)
+
+
+class TestRunPipeline(PipelineTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.add_trends(
+            Trend(trend_name="solar panels", trend_key="solar panels"),
+            Trend(trend_name="electric cars", trend_key="electric cars"),
+        )
+
+    def test_single_mode_publishes_with_one_post_each(self):
+        self.run_stages("single")
+
+        for trend in self.trends().values():
+            self.assertEqual(trend.pipeline_state, TrendState.PUBLISHED)
+            self.assertEqual(trend.article_status, "published")
+            self.assertTrue(trend.article_image_location.endswith(".webp"))
+        posts: List[Dict[str, Any]] = self.wordpress.sent("POST", "posts")
+        self.assertEqual(len(posts), 2)
+        for post in posts:
+            self.assertEqual(post["status"], "publish")
+            self.assertEqual(post["tags"], [1, 2])
+            self.assertIn(post["featured_media"], (901, 902))
+            self.assertTrue(post["content"].startswith("Stub text for: Generate an article"))
+        self.assertEqual([method for method, _, _ in self.wordpress.requests].count("PUT"), 0)
+
+    def test_staged_mode_creates_drafts_and_publishes_them(self):
+        self.run_stages("staged")
+
+        trends: Dict[str, Trend] = self.trends()
+        for trend in trends.values():
+            self.assertEqual(trend.pipeline_state, TrendState.PUBLISHED)
+            self.assertTrue(trend.article_wordpress_updated)
+            self.assertTrue(trend.article_tags_added)
+            self.assertTrue(trend.article_excerpt_added)
+            self.assertEqual(self.wordpress.sent("PUT", f"posts/{trend.article_id}")[0]["status"], "publish")
+        posts: List[Dict[str, Any]] = self.wordpress.sent("POST", "posts")
+        self.assertEqual([post["status"] for post in posts], ["draft", "draft"])
+        self.assertEqual(sorted(trend.article_id for trend in trends.values()), [101, 102])
+
+    def test_staged_draft_finishes_in_single_mode(self):
+        self.add_trends(Trend(trend_name="wind farms", trend_key="wind farms", title="Wind Farms", article_id=55,
+                              pipeline_state=TrendState.CREATED))
+
+        self.run_stages("single")
+
+        draft: Trend = self.trends()["wind farms"]
+        self.assertEqual(draft.pipeline_state, TrendState.PUBLISHED)
+        self.assertEqual(draft.article_id, 55)
+        self.assertEqual(self.wordpress.sent("PUT", "posts/55")[0]["status"], "publish")
+        self.assertEqual(len(self.wordpress.sent("POST", "posts")), 2)
+
+    def test_failed_trend_does_not_hold_up_the_others(self):
+        self.add_trends(Trend(trend_name="broken", trend_key="broken"))
+
+        self.run_stages("single")
+
+        trends: Dict[str, Trend] = self.trends()
+        self.assertEqual(trends["broken"].pipeline_state, TrendState.UNIQUE)
+        self.assertIsNone(trends["broken"].title)
+        self.assertEqual(trends["solar panels"].pipeline_state, TrendState.PUBLISHED)
+        self.assertEqual(trends["electric cars"].pipeline_state, TrendState.PUBLISHED)
+
+
+class TestFlushRetry(PipelineTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.add_trends(*(Trend(trend_name=name, trend_key=name) for name in ("one", "two", "three")))
+        # Not pending in any stage; renaming a trend to its key breaks the unique index.
+        self.add_trends(Trend(trend_name="taken", trend_key="taken", pipeline_state=TrendState.DUPLICATE))
+
+    def rename(self, trend: Trend, key: str) -> None:
+        trend.trend_key = key
+        trend.pipeline_state = TrendState.UNIQUE
+
+    def test_unit_of_work_writes_the_rows_that_fit(self):
+        with UnitOfWork(batch_size=10) as unit:
+            trends: Dict[str, Trend] = {trend.trend_name: trend for trend in unit.query(main.trends_in_stage("dedup"))}
+            unit.apply(trends["one"], self.rename, "one, renamed")
+            unit.apply(trends["two"], self.rename, "taken")
+            unit.apply(trends["three"], self.rename, "three, renamed")
+
+            self.assertEqual(unit.flush(), [trends["two"].id])
+
+        stored: Dict[str, Trend] = self.trends()
+        self.assertEqual(stored["one"].trend_key, "one, renamed")
+        self.assertEqual(stored["three"].trend_key, "three, renamed")
+        self.assertEqual((stored["two"].trend_key, stored["two"].pipeline_state), ("two", TrendState.NEW))
+
+    def test_pipeline_marks_unwritten_trends_failed(self):
+        stage: Stage = Stage("rename", lambda: main.trends_in_stage("dedup"), lambda trend: trend.trend_name,
+                             lambda name: "taken" if name == "two" else f"{name}, renamed", self.rename, concurrency=3)
+        pipeline: Pipeline = Pipeline([stage], poll_interval=0.05, batch_size=3)
+
+        asyncio.run(pipeline.run())
+
+        stored: Dict[str, Trend] = self.trends()
+        self.assertEqual(stage.failed, {stored["two"].id})
+        self.assertEqual(stored["one"].pipeline_state, TrendState.UNIQUE)
+        self.assertEqual(stored["three"].trend_key, "three, renamed")
+        self.assertEqual(stored["two"].pipeline_state, TrendState.NEW)
+
+
+if __name__ == '__main__':
+    unittest.main()
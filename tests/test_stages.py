@@ -0,0 +1,90 @@
+import unittest
+from typing import List
+from unittest import mock
+
+import main
+from models import Session, Trend, TrendContent, TrendState
+
+
+class TestStageInputStates(unittest.TestCase):
+    def test_single_mode(self):
+        with mock.patch.object(main, "publish_mode", "single"):
+            self.assertEqual(main.stage_input_states("dedup"), [TrendState.NEW])
+            self.assertEqual(main.stage_input_states("content"), [TrendState.TITLED])
+            self.assertEqual(main.stage_input_states("publish"), [TrendState.OPTIMIZED])
+            self.assertEqual(main.stage_input_states("creation"), [])
+            self.assertEqual(main.stage_input_states("update"), [])
+
+    def test_staged_mode(self):
+        with mock.patch.object(main, "publish_mode", "staged"):
+            self.assertEqual(main.stage_input_states("creation"), [TrendState.TITLED])
+            self.assertEqual(main.stage_input_states("content"), [])
+            self.assertEqual(main.stage_input_states("content", has_draft=True), [TrendState.CREATED])
+            self.assertEqual(main.stage_input_states("update", has_draft=True), [TrendState.WRITTEN])
+
+    def test_drafts_follow_the_staged_chain_in_both_modes(self):
+        for mode in ("single", "staged"):
+            with mock.patch.object(main, "publish_mode", mode):
+                self.assertEqual(main.stage_input_states("publish", has_draft=True), [])
+                self.assertEqual(main.stage_input_states("creation", has_draft=True), [])
+                self.assertEqual(main.stage_input_states("tags", has_draft=True), [TrendState.UPDATED])
+                self.assertEqual(main.stage_input_states("featured_image", has_draft=True), [TrendState.OPTIMIZED])
+
+
+class TestTrendsInStage(unittest.TestCase):
+    def setUp(self) -> None:
+        db = Session()
+        db.query(TrendContent).delete()
+        db.query(Trend).delete()
+        # A draft created by the staged flow before the mode was switched, and a trend of the single flow.
+        db.add_all([
+            Trend(trend_name="draft", trend_key="draft", title="Draft", article_id=55, pipeline_state=TrendState.CREATED),
+            Trend(trend_name="ready", trend_key="ready", title="Ready", pipeline_state=TrendState.OPTIMIZED),
+            Trend(trend_name="image", trend_key="image", title="Image", article_id=56, pipeline_state=TrendState.OPTIMIZED),
+        ])
+        db.commit()
+        db.close()
+
+    def pending(self, stage: str) -> List[str]:
+        db = Session()
+        names: List[str] = sorted(trend.trend_name for trend in main.trends_in_stage(stage).with_session(db))
+        db.close()
+        return names
+
+    def test_mixed_mode_rows(self):
+        for mode in ("single", "staged"):
+            with mock.patch.object(main, "publish_mode", mode):
+                self.assertEqual(self.pending("content"), ["draft"])
+                self.assertEqual(self.pending("publish"), ["ready"])
+                self.assertEqual(self.pending("featured_image"), ["image"])
+                self.assertEqual(self.pending("creation"), [])
+
+
+class TestPublishArticle(unittest.TestCase):
+    def publish(self, article_id):
+        post_data = {
+            "article_id": article_id, "title": "Title", "content": "Body", "excerpt": "Excerpt", "tags": ["solar"],
+            "categories": [373], "image": "images/1.png", "image_id": 7, "status": "publish",
+        }
+        response = mock.Mock(status_code=200 if article_id else 201)
+        response.json.return_value = {"id": article_id or 90, "link": "https://example.com/post"}
+        with mock.patch.object(main, "wordpress") as wordpress, mock.patch.object(main, "ensure_tag_ids", return_value=[3]):
+            wordpress.post.return_value = response
+            published = main.publish_article(post_data)
+        return wordpress.post.call_args, published
+
+    def test_creates_a_post_for_a_new_trend(self):
+        (path,), kwargs = self.publish(None)[0]
+        self.assertEqual(path, "posts")
+        self.assertEqual(kwargs["json"]["featured_media"], 7)
+
+    def test_updates_the_existing_post(self):
+        ((path,), kwargs), published = self.publish(55)
+        self.assertEqual(path, "posts/55")
+        self.assertEqual(kwargs["json"]["tags"], [3])
+        self.assertEqual(kwargs["json"]["status"], "publish")
+        self.assertEqual(published, ({"id": 55, "link": "https://example.com/post"}, 7))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from typing import Any, Dict, List
+from unittest import mock
+
+import tag_index
+from models import WordPressTag, session
+
+
+class FakeWordPress:
+    """Serves `tags` newest first, one page per request, and creates tags with the next free id."""
+
+    def __init__(self, tags: List[Dict[str, Any]], fail: bool = False) -> None:
+        self.tags: List[Dict[str, Any]] = tags
+        self.fail: bool = fail
+
+    def get(self, url: str, params: Dict[str, Any]) -> mock.Mock:
+        if self.fail:
+            return mock.Mock(status_code=500)
+        ordered = sorted(self.tags, key=lambda tag: -tag["id"])
+        per_page, page = params["per_page"], params["page"]
+        pages: int = max(1, -(-len(ordered) // per_page))
+        response = mock.Mock(status_code=200, headers={"X-WP-TotalPages": str(pages)})
+        response.json.return_value = ordered[(page - 1) * per_page:page * per_page]
+        return response
+
+    def post(self, path: str, json: Dict[str, Any]) -> mock.Mock:
+        tag: Dict[str, Any] = {"id": max(tag["id"] for tag in self.tags) + 1, "name": json["name"]}
+        self.tags.append(tag)
+        response = mock.Mock(status_code=201)
+        response.json.return_value = tag
+        return response
+
+
+class TestRefreshTagIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        session.query(WordPressTag).delete()
+        session.commit()
+
+    def use(self, wordpress: FakeWordPress) -> None:
+        patcher = mock.patch.object(tag_index, "wordpress", wordpress)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_created_tags_do_not_hide_older_ones(self):
+        wordpress = FakeWordPress([{"id": 1, "name": "solar"}, {"id": 2, "name": "wind"}])
+        self.use(wordpress)
+        self.assertEqual(tag_index.refresh_tag_index(), 2)
+        session.commit()
+        # Created in the WordPress admin, then a newer tag created by the pipeline itself.
+        wordpress.tags.append({"id": 3, "name": "Hydro Power"})
+        self.assertEqual(tag_index.ensure_tag_ids(["batteries"]), [4])
+
+        self.assertEqual(tag_index.refresh_tag_index(), 2)
+        session.commit()
+        self.assertEqual(tag_index.lookup_tag("hydro  power"), 3)
+
+    def test_failed_first_crawl_is_retried_in_full(self):
+        wordpress = FakeWordPress([{"id": 1, "name": "solar"}, {"id": 2, "name": "wind"}], fail=True)
+        self.use(wordpress)
+        self.assertEqual(tag_index.refresh_tag_index(), 0)
+        self.assertEqual(tag_index.ensure_tag_ids(["batteries"]), [3])
+
+        wordpress.fail = False
+        tag_index.refresh_tag_index()
+        session.commit()
+        self.assertEqual(tag_index.lookup_tag("solar"), 1)
+        self.assertEqual(tag_index.lookup_tag("wind"), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()